@@ -1,6 +1,6 @@
 import React from 'react';
 import ReactTable, { CellInfo, Column } from 'react-table';
-import { fetchJsonFromServer } from './service';
+import { fetchJsonFromServer, subscribeToServer, ServerEvent } from './service';
 import { FaHourglassEnd } from 'react-icons/fa';
 import { formatSize } from './utils';
 import {
@@ -61,89 +61,120 @@ class Collection extends React.Component<Props, State> {
 
     _formatSize = (entry : EntrySummary) => formatSize(entry.size);
 
+    unsubscribe: (() => void) | null = null;
+
     componentDidMount() {
         if (this.props.err.isOk) {
-            fetchJsonFromServer("entries/" + this.name, null, "GET").then((data) => {
-                let cfgColumns = new Set();
-                let nonObjectConfig = false;
-                for (let e of data) {
-                    let config = e.config;
-                    if (typeof config != "object") {
-                        nonObjectConfig = true;
-                    } else {
-                        for (let key in config) {
-                            if (config.hasOwnProperty(key)) {
-                                cfgColumns.add(key);
-                            }
-                        }
-                    }
-                }
+            this.unsubscribe = subscribeToServer("?collection=" + encodeURIComponent(this.name), this._onEvent);
+            this.load();
+        }
+    }
 
-                let cfgColumnArray = Array.from(cfgColumns);
-
-                const column_defs = (cfgColumnArray.map((e, i) =>
-                ({
-                    id: "config_" + i,
-                    style: {"background": "#fffff0"},
-                    headerStyle: {"background": "#ffff90"},
-                    Header: e as string,
-                    accessor: "config." + e,
-                    Cell: this._cellConfigItem
-                })));
-
-                if (nonObjectConfig) {
-                    column_defs.unshift({
-                        id: "config",
-                        style: {"background": "#fffff0"},
-                        headerStyle: {"background": "#ffff90"},
-                        Header: "Config",
-                        accessor: "config",
-                        Cell: this._cellConfigItem
-                    });
+    componentWillUnmount() {
+        if (this.unsubscribe) {
+            this.unsubscribe();
+            this.unsubscribe = null;
+        }
+    }
+
+    load() {
+        fetchJsonFromServer("entries/" + this.name, null, "GET").then((data) => {
+            this.setData(data);
+        }).catch((error) => {
+            console.log(error);
+            this.props.err.setFetchError();
+        });
+    }
+
+    _onEvent = (event : ServerEvent) => {
+        if (event.type === "reset") {
+            this.load();
+        } else if (event.type === "entry") {
+            const {type, collection, ...entry} = event;
+            const data = this.state.data.filter((e) => e.key !== entry.key);
+            data.push(entry as EntrySummary);
+            this.setData(data);
+        } else if (event.type === "removed") {
+            const keys = new Set(event.keys);
+            this.setData(this.state.data.filter((e) => !keys.has(e.key)));
+        }
+    }
+
+    setData(data : EntrySummary[]) {
+        let cfgColumns = new Set();
+        let nonObjectConfig = false;
+        for (let e of data) {
+            let config = e.config;
+            if (typeof config != "object") {
+                nonObjectConfig = true;
+            } else {
+                for (let key in config) {
+                    if (config.hasOwnProperty(key)) {
+                        cfgColumns.add(key);
+                    }
                 }
+            }
+        }
 
-                const config_column : Column = {
-                    id: "config",
-                    Header: "Config",
-                    columns: column_defs
-                };
-
-                const columns = [config_column,
-                    {
-                        "Header": "Value",
-                        "columns": [ {
-                            "style": {"background": "#f0fff0"},
-                            headerStyle: {"background": "#90ff90"},
-                            Header: "Repr",
-                            accessor: "value_repr",
-                            Cell: this._cellValueRepr
-                        },
-                        {
-                            id: "size",
-                            Header: "Size",
-                            accessor: this._formatSize,
-                            maxWidth: 100,
-                        },
-                        {
-                            id: "timestamp",
-                            Header: "Timestamp",
-                            accessor: "created",
-                            maxWidth: 200,
-                        }
-                    ]
-                    },
-                ]
-                console.log(cfgColumns);
-                this.setState({
-                    data: data,
-                    columns: columns,
-                    loading: false
-                });
-            }).catch((error) => {
-                console.log(error);
-                this.props.err.setFetchError();
+        let cfgColumnArray = Array.from(cfgColumns);
+
+        const column_defs = (cfgColumnArray.map((e, i) =>
+        ({
+            id: "config_" + i,
+            style: {"background": "#fffff0"},
+            headerStyle: {"background": "#ffff90"},
+            Header: e as string,
+            accessor: "config." + e,
+            Cell: this._cellConfigItem
+        })));
+
+        if (nonObjectConfig) {
+            column_defs.unshift({
+                id: "config",
+                style: {"background": "#fffff0"},
+                headerStyle: {"background": "#ffff90"},
+                Header: "Config",
+                accessor: "config",
+                Cell: this._cellConfigItem
             });
         }
+
+        const config_column : Column = {
+            id: "config",
+            Header: "Config",
+            columns: column_defs
+        };
+
+        const columns = [config_column,
+            {
+                "Header": "Value",
+                "columns": [ {
+                    "style": {"background": "#f0fff0"},
+                    headerStyle: {"background": "#90ff90"},
+                    Header: "Repr",
+                    accessor: "value_repr",
+                    Cell: this._cellValueRepr
+                },
+                {
+                    id: "size",
+                    Header: "Size",
+                    accessor: this._formatSize,
+                    maxWidth: 100,
+                },
+                {
+                    id: "timestamp",
+                    Header: "Timestamp",
+                    accessor: "created",
+                    maxWidth: 200,
+                }
+            ]
+            },
+        ]
+        this.setState({
+            data: data,
+            columns: columns,
+            loading: false
+        });
     }
 
     get name() : string {
@@ -1,6 +1,6 @@
 import React from 'react';
 import ReactTable, { CellInfo, Column } from 'react-table';
-import { fetchFromServer, fetchJsonFromServer } from './service';
+import { fetchFromServer, fetchJsonFromServer, subscribeToServer, ServerEvent } from './service';
 import { formatSize } from './utils';
 import {
     Link
@@ -16,10 +16,12 @@ interface Props {
 }
 
 interface ExecutorSummary {
-    id: string,
+    id: number,
     type: string,
     version: string,
     resources: string,
+    status?: string,
+    stats?: any,
 }
 
 interface State {
@@ -34,17 +36,48 @@ class Executors extends React.Component<Props, State> {
         this.state = {data: [], loading: true}
     }
 
+    unsubscribe: (() => void) | null = null;
+
     componentDidMount() {
         if (this.props.err.isOk) {
-            fetchJsonFromServer("executors", null, "GET").then((data) => {
-                this.setState({
-                    data: data,
-                    loading: false
-                });
-            }).catch((error) => {
-                console.log(error);
-                this.props.err.setFetchError();
+            this.unsubscribe = subscribeToServer("", this._onEvent);
+            this.load();
+        }
+    }
+
+    componentWillUnmount() {
+        if (this.unsubscribe) {
+            this.unsubscribe();
+            this.unsubscribe = null;
+        }
+    }
+
+    load() {
+        fetchJsonFromServer("executors", null, "GET").then((data) => {
+            this.setState({
+                data: data,
+                loading: false
             });
+        }).catch((error) => {
+            console.log(error);
+            this.props.err.setFetchError();
+        });
+    }
+
+    _onEvent = (event : ServerEvent) => {
+        if (event.type === "reset") {
+            this.load();
+        } else if (event.type === "executor") {
+            const index = this.state.data.findIndex((e) => e.id === event.id);
+            if (index === -1) {
+                // A new executor, its type and resources are not in the event
+                this.load();
+                return;
+            }
+            const data = this.state.data.slice();
+            const {type, ...changes} = event;
+            data[index] = {...data[index], ...changes};
+            this.setState({data: data});
         }
     }
 
@@ -28,3 +28,24 @@ export async function fetchJsonFromServer(
   const response = await fetchFromServer(link, body ? JSON.stringify(body) : null, method);
   return response.json();
 }
+
+export interface ServerEvent {
+  type: string,
+  [key: string]: any
+}
+
+/**
+ * Opens a stream of server-sent events (changes of entries and executors);
+ * returns a function that closes the stream
+ */
+export function subscribeToServer(
+  query: string,
+  onEvent: (event: ServerEvent) => void
+) {
+  const source = new EventSource(SERVER_URL + "events" + query);
+  const handler = (e: Event) => onEvent(JSON.parse((e as MessageEvent).data));
+  for (const type of ["entry", "removed", "executor", "reset"]) {
+    source.addEventListener(type, handler);
+  }
+  return () => source.close();
+}
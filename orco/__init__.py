@@ -1,4 +1,5 @@
 
 from .obj import Obj  # noqa
 from .runtime import Runtime  # noqa
-from .executor import LocalExecutor  # noqa
\ No newline at end of file
+from .executor import LocalExecutor  # noqa
+from .task import Failure  # noqa
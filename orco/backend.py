@@ -0,0 +1,184 @@
+import hashlib
+
+from . import serializers
+
+
+def serialize_value(value, serializer=None):
+    """Returns (content hash, serialized value); values are stored once per content hash"""
+    data = serializers.dumps(value, serializer)
+    return hashlib.sha256(data).digest(), data
+
+
+class Backend:
+
+    """
+    Storage of collections, entries, dependencies between entries and executors
+
+    Entry is identified by (collection name, key). Entry without a value is a
+    placeholder announced by an executor; it is considered lost (and
+    invisible) when the heartbeat of its executor expires.
+    """
+
+    def close(self):
+        pass
+
+    def ensure_collection(self, name, indexes=(), version=None):
+        """
+        Creates the collection when it does not exist. When 'version' is not None and
+        differs from the stored version, finished entries built with another version and
+        all entries that transitively depend on them are removed, memoized dep_fn
+        results of the collection are forgotten. Returns the number of removed entries.
+        """
+        raise NotImplementedError
+
+    def create_entry(self, entry):
+        raise NotImplementedError
+
+    def set_entry_value(self, executor_id, entry):
+        raise NotImplementedError
+
+    def set_entry_values(self, executor_id, entries):
+        """Sets values of announced entries in one transaction"""
+        raise NotImplementedError
+
+    def get_build_times(self):
+        """Returns average durations of build_fn for collections that have any history"""
+        raise NotImplementedError
+
+    def get_entry_by_config(self, collection, config):
+        raise NotImplementedError
+
+    def has_entry_by_key(self, collection, key):
+        raise NotImplementedError
+
+    def get_entries(self, collection, keys):
+        """
+        Batched lookup of finished entries; returns (pickled value, created)
+        for each key in the order of keys, None for missing entries
+        """
+        raise NotImplementedError
+
+    def has_entries(self, collection, keys):
+        """Returns a list of bools (finished entry exists) in the order of keys"""
+        raise NotImplementedError
+
+    def get_entry_state(self, collection, key):
+        """Returns None, "announced" or "finished" """
+        raise NotImplementedError
+
+    def get_entry_states(self, ref_keys):
+        """Batched get_entry_state for a list of (collection name, key)"""
+        raise NotImplementedError
+
+    def get_cached_deps(self, ref_keys):
+        """
+        Returns memoized results of dep_fn for a list of (collection name, key);
+        each result is a list of (collection name, config) or None when not cached
+        """
+        raise NotImplementedError
+
+    def set_cached_deps(self, items):
+        """Memoizes results of dep_fn; items are pairs ((collection name, key), [(collection name, config)])"""
+        raise NotImplementedError
+
+    def clear_cached_deps(self, collection_name):
+        raise NotImplementedError
+
+    def remove_entry_by_key(self, collection, key):
+        raise NotImplementedError
+
+    def remove_entries(self, collection_key_pairs):
+        raise NotImplementedError
+
+    def announce_entries(self, executor_id, refs, deps=()):
+        """
+        Creates placeholders for refs and stores deps (pairs of refs (input, output)).
+        Returns False (and changes nothing) when an entry already exists.
+        """
+        raise NotImplementedError
+
+    def unannounce_entries(self, executor_id, ref_keys):
+        """Removes unfinished entries announced by the executor; ref_keys are (collection name, key)"""
+        raise NotImplementedError
+
+    def find_entries(self, collection, filter):
+        raise NotImplementedError
+
+    def export_entries(self, collection_name, after_key=None, limit=1000):
+        """
+        Returns up to 'limit' finished entries of the collection with keys greater than 'after_key',
+        ordered by key, as tuples (key, pickled config, pickled value, value_repr, created)
+        """
+        raise NotImplementedError
+
+    def update_access_times(self, accessed):
+        """Stores times of the last access; accessed is an iterable of (collection name, key, time)"""
+        raise NotImplementedError
+
+    def evict_entries(self, collection_name, max_bytes=None, max_entries=None, ttl=None):
+        """
+        Removes least recently accessed finished entries of the collection until
+        the limits are met and entries not accessed for 'ttl' seconds.
+        Inputs of unfinished entries are never removed. Returns the number of removed entries.
+        """
+        raise NotImplementedError
+
+    def change_counter(self):
+        """Returns a cheap value that changes whenever the stored data change"""
+        raise NotImplementedError
+
+    def collection_summaries(self):
+        raise NotImplementedError
+
+    def entry_summaries(self, collection, filter=None):
+        raise NotImplementedError
+
+    def register_executor(self, executor):
+        raise NotImplementedError
+
+    def executor_summaries(self):
+        raise NotImplementedError
+
+    def update_heartbeat(self, id):
+        raise NotImplementedError
+
+    def update_stats(self, id, stats):
+        raise NotImplementedError
+
+    def stop_executor(self, id):
+        raise NotImplementedError
+
+
+def select_evicted(candidates, count, size, max_bytes, max_entries, ttl, now):
+    """
+    Picks keys to evict from candidates (key, size, accessed, protected)
+    ordered by the access time; count and size are totals of the collection.
+    """
+    result = []
+    for key, entry_size, accessed, protected in candidates:
+        expired = ttl is not None and (accessed or 0) < now - ttl
+        over = (max_entries is not None and count > max_entries) or \
+               (max_bytes is not None and size > max_bytes)
+        if not expired and not over:
+            break
+        if protected:
+            continue
+        result.append(key)
+        count -= 1
+        size -= entry_size
+    return result
+
+
+def create_backend(backend, path):
+    if isinstance(backend, type) and issubclass(backend, Backend):
+        return backend(path)
+    if backend == "sqlite":
+        from .db import DB
+        return DB(path)
+    if backend == "lmdb":
+        from .kvdb import LmdbDB
+        return LmdbDB(path)
+    if backend == "snapshot":
+        from .snapshot import SnapshotDB
+        return SnapshotDB(path)
+    raise Exception("Unknown backend '{}'".format(backend))
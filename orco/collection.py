@@ -3,9 +3,10 @@ from collections import namedtuple
 from datetime import datetime
 
 from .obj import Obj
-from .entry import Entry
+from .entry import Entry, LazyEntry
 from .task import Task
 from .ref import Ref
+from .serializers import get_serializer
 
 
 def _default_make_key_helper(obj, stream):
@@ -41,40 +42,104 @@ def default_make_key(config):
 
 class Collection:
 
-    def __init__(self, runtime, name: str, build_fn, dep_fn):
+    def __init__(self, runtime, name: str, build_fn, dep_fn, indexes=(),
+                 max_bytes=None, max_entries=None, ttl=None, cache_deps=False,
+                 build_fn_many=None, batch_size=64, version=None, init_fn=None, serializer="pickle"):
         self.runtime = runtime
         self.name = name
         self.build_fn = build_fn
+        self.build_fn_many = build_fn_many
+        self.batch_size = batch_size
         self.dep_fn = dep_fn
+        self.cache_deps = cache_deps
+        self.indexes = tuple(indexes)
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.version = version
+        self.init_fn = init_fn
+        self.serializer = get_serializer(serializer)
+
+    @property
+    def has_limits(self):
+        return self.max_bytes is not None or self.max_entries is not None or self.ttl is not None
 
     def ref(self, config):
         return Ref(self, config)
 
-    def compute(self, config):
-        return self.compute_many([config])[0]
+    def compute(self, config, keep_going=False):
+        return self.compute_many([config], keep_going=keep_going)[0]
 
     def get_entry(self, config):
-        return self.runtime.db.get_entry_by_config(self, config)
+        entry = self.runtime.db.get_entry_by_config(self, config)
+        if entry is not None and self.has_limits:
+            self.runtime.record_access(self, config)
+        return entry
 
     def has_entry(self, config):
         return self.runtime.db.has_entry_by_key(self, self.make_key(config))
 
+    def get_entries(self, configs):
+        """
+        Returns finished entries for configs (in the same order) with batched
+        DB queries; None marks a missing entry. Values are deserialized on the first access.
+        """
+        configs = list(configs)
+        result = []
+        rows = self.runtime.db.get_entries(self, [self.make_key(config) for config in configs])
+        for config, row in zip(configs, rows):
+            if row is None:
+                result.append(None)
+            else:
+                result.append(LazyEntry(self, config, row[0], row[1]))
+                if self.has_limits:
+                    self.runtime.record_access(self, config)
+        return result
+
+    def has_entries(self, configs):
+        """Returns a list of bools (finished entry exists) for configs, with batched DB queries"""
+        return self.runtime.db.has_entries(self, [self.make_key(config) for config in configs])
+
+    def find(self, filter=None):
+        """
+        Returns finished entries whose configs match the filter
+
+        >>> collection.find({"size": {">": 1000}, "algo": "x"})
+
+        Fields listed in 'indexes' of the collection are looked up through an index.
+        """
+        return self.runtime.db.find_entries(self, filter)
+
     def get_entry_by_status(self, config):
         return self.runtime.db.get_entry_state(self, self.make_key(config))
 
+    def clear_deps_cache(self):
+        """Forgets memoized results of dep_fn (for collections with cache_deps)"""
+        self.runtime.db.clear_cached_deps(self.name)
+
     def remove(self, config):
-        return self.runtime.db.remove_entry_by_key(self, self.make_key(config))
+        key = self.make_key(config)
+        result = self.runtime.db.remove_entry_by_key(self, key)
+        self.runtime.publish_removed(self.name, [key])
+        return result
 
     def remove_many(self, configs):
-        return self.runtime.db.remove_entries(
-            ((self.name, self.make_key(config)) for config in configs))
-
-    def compute_many(self, configs):
-        return self.runtime.compute_refs([self.ref(config) for config in configs])
+        keys = [self.make_key(config) for config in configs]
+        result = self.runtime.db.remove_entries((self.name, key) for key in keys)
+        self.runtime.publish_removed(self.name, keys)
+        return result
+
+    def compute_many(self, configs, keep_going=False):
+        """
+        Computes entries for configs. With 'keep_going', failing builds do not stop
+        the computation and Failure is returned in place of each entry that was not computed.
+        """
+        return self.runtime.compute_refs([self.ref(config) for config in configs], keep_going=keep_going)
 
     def insert(self, config, value):
         entry = Entry(self, config, value, datetime.now())
         self.runtime.db.create_entry(entry)
+        self.runtime.publish_entries([entry])
 
     def make_key(self, config):
         return default_make_key(config)
\ No newline at end of file
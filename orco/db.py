@@ -1,13 +1,124 @@
+import hashlib
 import sqlite3
 import pickle
 import json
+import time
 from concurrent.futures import ThreadPoolExecutor
 
 
+from .backend import Backend, select_evicted, serialize_value
+from . import serializers
 from .entry import Entry
+from .query import parse_filter, check_field, config_to_json
+
+
+def _quote_identifier(name):
+    return '"{}"'.format(name.replace('"', '""'))
+
+
+def _quote_string(value):
+    return "'{}'".format(value.replace("'", "''"))
 
 
-class DB:
+def _config_field_expr(field):
+    return "json_extract(config_json, '$.{}')".format(check_field(field))
+
+
+def _table_columns(conn, table):
+    return [row[1] for row in conn.execute("PRAGMA table_info({})".format(_quote_identifier(table)))]
+
+
+def _chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _key_values_sql(count):
+    return "(collection, key) IN (VALUES {})".format(", ".join(["(?, ?)"] * count))
+
+
+def _filter_to_sql(filter):
+    conditions = []
+    params = []
+    for field, op, value in parse_filter(filter):
+        expr = _config_field_expr(field)
+        if op == "in":
+            conditions.append("{} IN ({})".format(expr, ", ".join("?" * len(value))))
+            params.extend(value)
+        elif value is None and op in ("==", "!="):
+            conditions.append("{} IS {}NULL".format(expr, "NOT " if op == "!=" else ""))
+        else:
+            conditions.append("{} {} ?".format(expr, "=" if op == "==" else op))
+            params.append(value)
+    if conditions:
+        # Configs that cannot be stored in JSON do not match any filter
+        conditions.insert(0, "config_json IS NOT NULL")
+    return conditions, params
+
+
+# Tables are created by str.format() with their name (a migration builds them under a temporary name)
+_ENTRIES_TABLE = """
+    CREATE TABLE IF NOT EXISTS {} (
+        collection STRING NOT NULL,
+        key TEXT NOT NULL,
+        config BLOB NOT NULL,
+        config_json TEXT,
+        value_hash BLOB,
+        value_size INTEGER,
+        value_repr STRING,
+        created TEXT,
+        accessed REAL,
+        version TEXT,
+
+        executor INTEGER,
+
+        PRIMARY KEY (collection, key)
+        CONSTRAINT collection_ref
+            FOREIGN KEY (collection)
+            REFERENCES collections(name)
+            ON DELETE CASCADE
+        CONSTRAINT executor_ref
+            FOREIGN KEY (executor)
+            REFERENCES executors(id)
+            ON DELETE CASCADE
+    );
+"""
+
+_BLOBS_TABLE = """
+    CREATE TABLE IF NOT EXISTS blobs (
+        hash BLOB NOT NULL PRIMARY KEY,
+        data BLOB NOT NULL,
+        refcount INTEGER NOT NULL
+    );
+"""
+
+# Edges are kept when their input is removed, so the output can be found
+# as stale when the collection of the input changes its version
+_DEPS_TABLE = """
+    CREATE TABLE IF NOT EXISTS {} (
+        collection_s STRING NOT NULL,
+        key_s TEXT NOT NULL,
+        collection_t STRING NOT NULL,
+        key_t TEXT NOT NULL,
+
+        UNIQUE(collection_s, key_s, collection_t, key_t),
+
+        CONSTRAINT entry_t_ref
+            FOREIGN KEY (collection_t, key_t)
+            REFERENCES entries(collection, key)
+            ON DELETE CASCADE
+    );
+"""
+
+
+class DB(Backend):
+
+    # Number of (collection, key) pairs in one batched query
+    BATCH_SIZE = 400
+
+    # Stored in PRAGMA user_version; databases created before it was introduced have 0
+    # 2: deps are not removed together with their inputs
+    SCHEMA_VERSION = 2
 
     DEAD_EXECUTOR_QUERY = "((STRFTIME('%s', heartbeat) + heartbeat_interval * 2) - STRFTIME('%s', 'now') < 0)"
     LIVE_EXECUTOR_QUERY = "((STRFTIME('%s', heartbeat) + heartbeat_interval * 2) - STRFTIME('%s', 'now') >= 0)"
@@ -17,11 +128,34 @@ class DB:
         self.executor.submit(self.init, path).result()
         assert self.conn is not None
 
+    def close(self):
+        self.executor.submit(self.conn.close).result()
+        self.executor.shutdown()
+
     def init(self, path):
         self.conn = sqlite3.connect(path)
+        schema_version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        if schema_version > self.SCHEMA_VERSION:
+            self.conn.close()
+            raise Exception("Database '{}' has schema version {}, this version of orco supports up to {}".format(
+                path, schema_version, self.SCHEMA_VERSION))
+        if schema_version < self.SCHEMA_VERSION and _table_columns(self.conn, "entries"):
+            # Foreign keys are still off, tables are rebuilt by the migration
+            self._migrate(schema_version)
+            if self.conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+                # Changing auto_vacuum of an existing database needs VACUUM (outside of a transaction),
+                # otherwise evict_entries could not return freed pages to the file system
+                self.conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+                self.conn.execute("VACUUM")
+        self.conn.execute("PRAGMA foreign_keys = ON")
+        # Has an effect only for a new database, it has to precede creating tables
+        self.conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
         self.conn.execute("""
             CREATE TABLE IF NOT EXISTS collections (
-                name TEXT NOT NULL PRIMARY KEY
+                name TEXT NOT NULL PRIMARY KEY,
+                build_count INTEGER NOT NULL DEFAULT 0,
+                build_time REAL NOT NULL DEFAULT 0,
+                version TEXT
             );
         """)
 
@@ -38,111 +172,291 @@ class DB:
             );
         """)
 
+        self.conn.execute(_ENTRIES_TABLE.format("entries"))
+
+        self.conn.execute("""
+            CREATE INDEX IF NOT EXISTS entries_accessed ON entries(collection, accessed);
+        """)
+
+        # Values are stored once by their content hash, 'refcount' counts entries pointing to
+        # a value; triggers maintain it also when entries are removed by a cascade
+        self.conn.execute(_BLOBS_TABLE)
+
+        self.conn.executescript("""
+            CREATE TRIGGER IF NOT EXISTS blob_ref_insert AFTER INSERT ON entries
+            WHEN NEW.value_hash IS NOT NULL
+            BEGIN
+                UPDATE blobs SET refcount = refcount + 1 WHERE hash = NEW.value_hash;
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS blob_ref_update AFTER UPDATE OF value_hash ON entries
+            BEGIN
+                UPDATE blobs SET refcount = refcount + 1 WHERE hash = NEW.value_hash;
+                UPDATE blobs SET refcount = refcount - 1 WHERE hash = OLD.value_hash;
+                DELETE FROM blobs WHERE hash = OLD.value_hash AND refcount = 0;
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS blob_ref_delete AFTER DELETE ON entries
+            WHEN OLD.value_hash IS NOT NULL
+            BEGIN
+                UPDATE blobs SET refcount = refcount - 1 WHERE hash = OLD.value_hash;
+                DELETE FROM blobs WHERE hash = OLD.value_hash AND refcount = 0;
+            END;
+        """)
+
+        self.conn.execute(_DEPS_TABLE.format("deps"))
+
         self.conn.execute("""
-            CREATE TABLE IF NOT EXISTS entries (
+            CREATE TABLE IF NOT EXISTS dep_cache (
                 collection STRING NOT NULL,
                 key TEXT NOT NULL,
-                config BLOB NOT NULL,
-                value BLOB,
-                value_repr STRING,
-                created TEXT,
-
-                executor INTEGER,
+                deps BLOB NOT NULL,
 
                 PRIMARY KEY (collection, key)
                 CONSTRAINT collection_ref
                     FOREIGN KEY (collection)
                     REFERENCES collections(name)
                     ON DELETE CASCADE
-                CONSTRAINT executor_ref
-                    FOREIGN KEY (executor)
-                    REFERENCES executors(uuid)
-                    ON DELETE CASCADE
             );
         """)
 
-        self.conn.execute("""
-            CREATE TABLE IF NOT EXISTS deps (
-                collection_s STRING NOT NULL,
-                key_s STRING NOT NULL,
-                collection_t STRING NOT NULL,
-                key_t STRING NOT NULL,
-
-                UNIQUE(collection_s, key_s, collection_t, key_t),
-
-                CONSTRAINT entry_s_ref
-                    FOREIGN KEY (collection_s, key_s)
-                    REFERENCES entries(collection, key)
-                    ON DELETE CASCADE,
-                CONSTRAINT entry_t_ref
-                    FOREIGN KEY (collection_t, key_t)
-                    REFERENCES entries(collection, key)
-                    ON DELETE CASCADE
-            );
-        """)
+        self.conn.execute("PRAGMA user_version = {}".format(self.SCHEMA_VERSION))
 
-    def ensure_collection(self, name):
+    def _migrate(self, schema_version):
+        """Converts a database created by an older version of orco"""
+        c = self.conn.cursor()
+        c.execute("BEGIN")
+        try:
+            if schema_version == 0:
+                self._migrate_unversioned(c)
+            else:
+                c.execute(_DEPS_TABLE.format("deps_new"))
+                c.execute("INSERT INTO deps_new SELECT * FROM deps")
+                c.execute("DROP TABLE deps")
+                c.execute("ALTER TABLE deps_new RENAME TO deps")
+            self.conn.commit()
+        except BaseException:
+            self.conn.rollback()
+            raise
+
+    def _migrate_unversioned(self, c):
+        # Databases created before schema versions were introduced
+        columns = _table_columns(c, "collections")
+        for name, definition in (("build_count", "INTEGER NOT NULL DEFAULT 0"),
+                                 ("build_time", "REAL NOT NULL DEFAULT 0"),
+                                 ("version", "TEXT")):
+            if name not in columns:
+                c.execute("ALTER TABLE collections ADD COLUMN {} {}".format(name, definition))
+
+        # entries and deps are rebuilt: old entries refer to a non-existing column
+        # of executors and old keys in deps have NUMERIC affinity
+        old_columns = _table_columns(c, "entries")
+        c.execute(_ENTRIES_TABLE.format("entries_new"))
+        copied = [name for name in _table_columns(c, "entries_new") if name in old_columns]
+        c.execute("INSERT INTO entries_new({0}) SELECT {0} FROM entries".format(", ".join(copied)))
+        if "config_json" not in old_columns:
+            c.executemany("UPDATE entries_new SET config_json = ? WHERE collection = ? AND key = ?",
+                          [(config_to_json(pickle.loads(config)), collection, key) for collection, key, config
+                           in c.execute("SELECT collection, key, config FROM entries_new").fetchall()])
+        if "accessed" not in old_columns:
+            c.execute("UPDATE entries_new SET accessed = ?", [time.time()])
+        c.execute(_BLOBS_TABLE)
+        if "value" in old_columns:
+            self._migrate_values(c)
+        c.execute("UPDATE blobs SET refcount = (SELECT COUNT(*) FROM entries_new WHERE value_hash = hash)")
+        c.execute("DELETE FROM blobs WHERE refcount = 0")
+
+        # Keys are taken from entries, the comparison converts them as old deps did
+        c.execute(_DEPS_TABLE.format("deps_new"))
+        c.execute("""
+            INSERT OR IGNORE INTO deps_new
+            SELECT s.collection, s.key, t.collection, t.key FROM deps
+            JOIN entries AS s ON s.collection = deps.collection_s AND s.key = deps.key_s
+            JOIN entries AS t ON t.collection = deps.collection_t AND t.key = deps.key_t
+        """)
+        c.execute("DROP TABLE deps")
+        c.execute("DROP TABLE entries")
+        c.execute("ALTER TABLE entries_new RENAME TO entries")
+        c.execute("ALTER TABLE deps_new RENAME TO deps")
+
+    def _migrate_values(self, c):
+        # Values stored inline in entries are moved into blobs; they are pickled,
+        # so they are stored as they are (the same as values of the default serializer)
+        rows = self.conn.execute("SELECT collection, key, value FROM entries WHERE value IS NOT NULL")
+        while True:
+            batch = rows.fetchmany(self.BATCH_SIZE)
+            if not batch:
+                break
+            updates = []
+            for collection, key, data in batch:
+                value_hash = hashlib.sha256(data).digest()
+                c.execute("INSERT OR IGNORE INTO blobs VALUES (?, ?, 0)", [value_hash, data])
+                updates.append((value_hash, len(data), collection, key))
+            c.executemany("UPDATE entries_new SET value_hash = ?, value_size = ? WHERE collection = ? AND key = ?",
+                          updates)
+
+    def ensure_collection(self, name, indexes=(), version=None):
         def _helper():
             c = self.conn.cursor()
-            c.execute("INSERT OR IGNORE INTO collections VALUES (?)", [name])
+            c.execute("INSERT OR IGNORE INTO collections(name) VALUES (?)", [name])
+            for field in indexes:
+                c.execute("CREATE INDEX IF NOT EXISTS {} ON entries(collection, {}) WHERE collection = {}".format(
+                    _quote_identifier("config_index/{}/{}".format(name, field)),
+                    _config_field_expr(field),
+                    _quote_string(name)))
+            removed = 0
+            if version is not None:
+                c.execute("SELECT version FROM collections WHERE name = ?", [name])
+                if c.fetchone()[0] != version:
+                    removed = self._remove_stale(c, name, version)
+                    c.execute("DELETE FROM dep_cache WHERE collection = ?", [name])
+                    c.execute("UPDATE collections SET version = ? WHERE name = ?", [version, name])
             self.conn.commit()
-        self.executor.submit(_helper).result()
+            return removed
+        return self.executor.submit(_helper).result()
+
+    def _remove_stale(self, c, name, version):
+        # Outputs of removed inputs were computed from an older version (their deps are kept).
+        # Placeholders of running computations are kept, their executors remove them on failure
+        c.execute("""
+            WITH RECURSIVE stale(collection, key) AS (
+                SELECT collection, key FROM entries
+                WHERE collection = ? AND value_hash IS NOT NULL AND version IS NOT ?
+                UNION
+                SELECT collection_s, key_s FROM deps
+                WHERE collection_s = ? AND NOT EXISTS (
+                    SELECT 1 FROM entries
+                    WHERE collection = collection_s AND key = key_s AND value_hash IS NOT NULL)
+                UNION
+                SELECT collection_t, key_t FROM deps
+                JOIN stale ON collection_s = stale.collection AND key_s = stale.key
+            )
+            DELETE FROM entries
+            WHERE (collection, key) IN (SELECT collection, key FROM stale) AND value_hash IS NOT NULL
+        """, [name, version, name])
+        return c.rowcount
 
     def create_entry(self, entry):
+        value_hash, data = serialize_value(entry.value, entry.collection.serializer)
+        entry.value_size = len(data)
         def _helper():
             collection = entry.collection
             c = self.conn.cursor()
-            c.execute("INSERT INTO entries VALUES (?, ?, ?, ?, ?, ?, null)",
-                    [collection.name,
-                    collection.make_key(entry.config),
-                    pickle.dumps(entry.config),
-                    pickle.dumps(entry.value),
-                    entry.value_repr,
-                    entry.created])
-            self.conn.commit()
+            try:
+                c.execute("INSERT OR IGNORE INTO blobs VALUES (?, ?, 0)", [value_hash, data])
+                c.execute("INSERT INTO entries(collection, key, config, config_json, value_hash, value_size, value_repr, created, accessed, version) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        [collection.name,
+                        collection.make_key(entry.config),
+                        pickle.dumps(entry.config),
+                        config_to_json(entry.config),
+                        value_hash,
+                        len(data),
+                        entry.value_repr,
+                        entry.created,
+                        time.time(),
+                        collection.version])
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+                raise
         self.executor.submit(_helper).result()
 
     def set_entry_value(self, executor_id, entry):
+        self.set_entry_values(executor_id, [entry])
+
+    def set_entry_values(self, executor_id, entries):
+        now = time.time()
+        blobs = {}
+        rows = []
+        for entry in entries:
+            value_hash, data = serialize_value(entry.value, entry.collection.serializer)
+            entry.value_size = len(data)
+            blobs[value_hash] = data
+            rows.append([value_hash,
+                         len(data),
+                         entry.value_repr,
+                         entry.created,
+                         now,
+                         entry.collection.version,
+                         entry.collection.name,
+                         entry.collection.make_key(entry.config),
+                         executor_id])
+        build_times = {}
+        for entry in entries:
+            if entry.comp_time is not None:
+                count, total = build_times.get(entry.collection.name, (0, 0))
+                build_times[entry.collection.name] = (count + 1, total + entry.comp_time)
+
         def _helper():
-            collection = entry.collection
             c = self.conn.cursor()
-            c.execute("UPDATE entries SET value = ?, value_repr = ?, created = ? WHERE collection = ? AND key = ? AND executor = ? AND value is null",
-                    [pickle.dumps(entry.value),
-                     entry.value_repr,
-                     entry.created,
-                     collection.name,
-                     collection.make_key(entry.config),
-                     executor_id
-                    ])
+            c.executemany("INSERT OR IGNORE INTO blobs VALUES (?, ?, 0)", blobs.items())
+            c.executemany("UPDATE entries SET value_hash = ?, value_size = ?, value_repr = ?, created = ?, accessed = ?, version = ? WHERE collection = ? AND key = ? AND executor = ? AND value_hash is null",
+                          rows)
+            if c.rowcount != len(rows):
+                self.conn.rollback()
+                return False
+            c.executemany("UPDATE collections SET build_count = build_count + ?, build_time = build_time + ? WHERE name = ?",
+                          [(count, total, name) for name, (count, total) in build_times.items()])
             self.conn.commit()
-            return c.rowcount
-        if self.executor.submit(_helper).result() != 1:
-            raise Exception("Setting value to unannouced config: {}/{}".format(entry.collection.name, entry.config))
+            return True
+        if not self.executor.submit(_helper).result():
+            raise Exception("Setting value to unannouced config: {}".format(
+                ", ".join("{}/{}".format(entry.collection.name, entry.config) for entry in entries)))
+
+    def get_build_times(self):
+        def _helper():
+            c = self.conn.cursor()
+            c.execute("SELECT name, build_time / build_count FROM collections WHERE build_count > 0")
+            return dict(c.fetchall())
+        return self.executor.submit(_helper).result()
 
     def get_entry_by_config(self, collection, config):
         key = collection.make_key(config)
         def _helper():
             c = self.conn.cursor()
-            c.execute("SELECT value, created FROM entries WHERE collection = ? AND key = ? AND (value is not null OR executor is null OR executor in (SELECT id FROM executors WHERE {}))".format(self.LIVE_EXECUTOR_QUERY),
+            c.execute("SELECT data, created FROM entries LEFT JOIN blobs ON hash = value_hash WHERE collection = ? AND key = ? AND (value_hash is not null OR executor is null OR executor in (SELECT id FROM executors WHERE {}))".format(self.LIVE_EXECUTOR_QUERY),
                     [collection.name, key])
             return c.fetchone()
         result = self.executor.submit(_helper).result()
         if result is None:
             return None
-        return Entry(collection, config, pickle.loads(result[0]) if result[0] is not None else None, result[1])
+        return Entry(collection, config, serializers.loads(result[0]) if result[0] is not None else None, result[1])
 
     def has_entry_by_key(self, collection, key):
         def _helper():
             c = self.conn.cursor()
-            c.execute("SELECT COUNT(*) FROM entries WHERE collection = ? AND key = ? AND value is not null",
+            c.execute("SELECT COUNT(*) FROM entries WHERE collection = ? AND key = ? AND value_hash is not null",
                       [collection.name, key])
             return bool(c.fetchone()[0])
         return self.executor.submit(_helper).result()
 
+    def get_entries(self, collection, keys):
+        def _helper():
+            c = self.conn.cursor()
+            result = {}
+            for chunk in _chunks(keys, self.BATCH_SIZE):
+                c.execute("SELECT key, data, created FROM entries JOIN blobs ON hash = value_hash WHERE collection = ? AND key IN ({})".format(
+                    ", ".join(["?"] * len(chunk))), [collection.name] + chunk)
+                for key, data, created in c.fetchall():
+                    result[key] = (data, created)
+            return [result.get(key) for key in keys]
+        return self.executor.submit(_helper).result()
+
+    def has_entries(self, collection, keys):
+        def _helper():
+            c = self.conn.cursor()
+            result = set()
+            for chunk in _chunks(keys, self.BATCH_SIZE):
+                c.execute("SELECT key FROM entries WHERE collection = ? AND value_hash is not null AND key IN ({})".format(
+                    ", ".join(["?"] * len(chunk))), [collection.name] + chunk)
+                result.update(key for key, in c.fetchall())
+            return [key in result for key in keys]
+        return self.executor.submit(_helper).result()
+
     def get_entry_state(self, collection, key):
         def _helper():
             c = self.conn.cursor()
-            c.execute("SELECT value is not null FROM entries WHERE collection = ? AND key = ? AND (value is not null OR executor is null OR executor in (SELECT id FROM executors WHERE {}))".format(self.LIVE_EXECUTOR_QUERY),
+            c.execute("SELECT value_hash is not null FROM entries WHERE collection = ? AND key = ? AND (value_hash is not null OR executor is null OR executor in (SELECT id FROM executors WHERE {}))".format(self.LIVE_EXECUTOR_QUERY),
                       [collection.name, key])
             v = c.fetchone()
             if v is None:
@@ -153,6 +467,45 @@ class DB:
                 return "announced"
         return self.executor.submit(_helper).result()
 
+    def get_entry_states(self, ref_keys):
+        def _helper():
+            c = self.conn.cursor()
+            result = {}
+            for chunk in _chunks(ref_keys, self.BATCH_SIZE):
+                c.execute("SELECT collection, key, value_hash is not null FROM entries WHERE {} AND (value_hash is not null OR executor is null OR executor in (SELECT id FROM executors WHERE {}))".format(
+                    _key_values_sql(len(chunk)), self.LIVE_EXECUTOR_QUERY),
+                    [v for ref_key in chunk for v in ref_key])
+                for collection_name, key, finished in c.fetchall():
+                    result[(collection_name, key)] = "finished" if finished else "announced"
+            return [result.get(ref_key) for ref_key in ref_keys]
+        return self.executor.submit(_helper).result()
+
+    def get_cached_deps(self, ref_keys):
+        def _helper():
+            c = self.conn.cursor()
+            result = {}
+            for chunk in _chunks(ref_keys, self.BATCH_SIZE):
+                c.execute("SELECT collection, key, deps FROM dep_cache WHERE {}".format(_key_values_sql(len(chunk))),
+                          [v for ref_key in chunk for v in ref_key])
+                for collection_name, key, deps in c.fetchall():
+                    result[(collection_name, key)] = deps
+            return result
+        result = self.executor.submit(_helper).result()
+        return [pickle.loads(result[ref_key]) if ref_key in result else None for ref_key in ref_keys]
+
+    def set_cached_deps(self, items):
+        data = [(collection_name, key, pickle.dumps(deps)) for (collection_name, key), deps in items]
+        def _helper():
+            self.conn.executemany("INSERT OR REPLACE INTO dep_cache VALUES (?, ?, ?)", data)
+            self.conn.commit()
+        self.executor.submit(_helper).result()
+
+    def clear_cached_deps(self, collection_name):
+        def _helper():
+            self.conn.execute("DELETE FROM dep_cache WHERE collection = ?", [collection_name])
+            self.conn.commit()
+        self.executor.submit(_helper).result()
+
     """
     def get_entry_by_key(self, collection, key):
         def _helper():
@@ -171,47 +524,65 @@ class DB:
         def _helper():
             self.conn.execute("DELETE FROM entries WHERE collection = ? AND key = ?",
                 [collection.name, key])
+            self.conn.commit()
         self.executor.submit(_helper).result()
 
     def remove_entries(self, collection_key_pairs):
         def _helper():
             self.conn.executemany("DELETE FROM entries WHERE collection = ? AND key = ?", collection_key_pairs)
+            self.conn.commit()
         self.executor.submit(_helper).result()
 
+    def change_counter(self):
+        def _helper():
+            # data_version changes on commits of other connections, total_changes on ours
+            data_version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+            return data_version, self.conn.total_changes
+        return self.executor.submit(_helper).result()
+
     def collection_summaries(self):
         def _helper():
             c = self.conn.cursor()
-            r = c.execute("SELECT collection, COUNT(key), TOTAL(length(value)), TOTAL(length(config)) FROM entries GROUP BY collection ORDER BY collection")
+            r = c.execute("SELECT collection, COUNT(key), TOTAL(value_size), TOTAL(length(config)) FROM entries GROUP BY collection ORDER BY collection")
             result = []
-            found = set()
+            found = {}
             for name, count, size_value, size_config in r.fetchall():
-                found.add(name)
+                found[name] = size_config
                 result.append({"name": name, "count": count, "size": size_value + size_config})
 
+            # Physical size counts each distinct value of the collection once
+            c.execute("""SELECT collection, TOTAL(length(data)) FROM
+                         (SELECT DISTINCT collection, value_hash FROM entries WHERE value_hash is not null)
+                         JOIN blobs ON hash = value_hash GROUP BY collection""")
+            physical = dict(c.fetchall())
+            for item in result:
+                item["physical_size"] = physical.get(item["name"], 0) + found[item["name"]]
+
             c.execute("SELECT name FROM collections")
             for x in r.fetchall():
                 name = x[0]
                 if name in found:
                     continue
-                result.append({"name": name, "count": 0, "size": 0})
+                result.append({"name": name, "count": 0, "size": 0, "physical_size": 0})
 
             result.sort(key=lambda x: x["name"])
             return result
         return self.executor.submit(_helper).result()
 
     def _cleanup_lost_entries(self, cursor):
-        cursor.execute("DELETE FROM entries WHERE value is null AND executor IN (SELECT id FROM executors WHERE {})".format(self.DEAD_EXECUTOR_QUERY))
+        cursor.execute("DELETE FROM entries WHERE value_hash is null AND executor IN (SELECT id FROM executors WHERE {})".format(self.DEAD_EXECUTOR_QUERY))
 
-    def announce_entries(self, executor_id, refs, deps):
+    def announce_entries(self, executor_id, refs, deps=()):
         def _helper():
             c = self.conn.cursor()
             self._cleanup_lost_entries(c)
             self.conn.commit()
             try:
-                c.executemany("INSERT INTO entries(collection, key, config, executor) VALUES (?, ?, ?, ?)",
+                c.executemany("INSERT INTO entries(collection, key, config, config_json, executor) VALUES (?, ?, ?, ?, ?)",
                     [[r.collection.name,
                       r.collection.make_key(r.config),
                       pickle.dumps(r.config),
+                      config_to_json(r.config),
                       executor_id] for r in refs])
                 c.executemany("INSERT INTO deps VALUES (?, ?, ?, ?)", [
                     [r1.collection.name,
@@ -227,10 +598,72 @@ class DB:
                 return False
         return self.executor.submit(_helper).result()
 
-    def entry_summaries(self, collection):
+    def unannounce_entries(self, executor_id, ref_keys):
+        def _helper():
+            self.conn.executemany("DELETE FROM entries WHERE collection = ? AND key = ? AND executor = ? AND value_hash is null",
+                                  [(collection_name, key, executor_id) for collection_name, key in ref_keys])
+            self.conn.commit()
+        self.executor.submit(_helper).result()
+
+    def find_entries(self, collection, filter):
+        conditions, params = _filter_to_sql(filter)
+        conditions.insert(0, "collection = {}".format(_quote_string(collection.name)))
+        conditions.append("value_hash is not null")
+        def _helper():
+            c = self.conn.cursor()
+            r = c.execute("SELECT config, data, created FROM entries JOIN blobs ON hash = value_hash WHERE {}".format(" AND ".join(conditions)), params)
+            return r.fetchall()
+        return [Entry(collection, pickle.loads(config), serializers.loads(value), created)
+                for config, value, created in self.executor.submit(_helper).result()]
+
+    def export_entries(self, collection_name, after_key=None, limit=1000):
+        def _helper():
+            c = self.conn.cursor()
+            c.execute("SELECT key, config, data, value_repr, created FROM entries JOIN blobs ON hash = value_hash "
+                      "WHERE collection = ? AND key > ? ORDER BY key LIMIT ?",
+                      [collection_name, after_key if after_key is not None else "", limit])
+            return c.fetchall()
+        return self.executor.submit(_helper).result()
+
+    def update_access_times(self, accessed):
+        def _helper():
+            self.conn.executemany("UPDATE entries SET accessed = MAX(COALESCE(accessed, 0), ?) WHERE collection = ? AND key = ?",
+                                  [(t, collection_name, key) for collection_name, key, t in accessed])
+            self.conn.commit()
+        self.executor.submit(_helper).result()
+
+    def evict_entries(self, collection_name, max_bytes=None, max_entries=None, ttl=None):
+        def _helper():
+            c = self.conn.cursor()
+            c.execute("BEGIN IMMEDIATE")
+            try:
+                c.execute("SELECT COUNT(*), TOTAL(value_size) + TOTAL(length(config)) FROM entries WHERE collection = ? AND value_hash is not null",
+                          [collection_name])
+                count, size = c.fetchone()
+                c.execute("""
+                    SELECT key, length(config) + value_size, accessed,
+                           EXISTS(SELECT 1 FROM deps JOIN entries AS t ON t.collection = deps.collection_t AND t.key = deps.key_t
+                                  WHERE deps.collection_s = e.collection AND deps.key_s = e.key AND t.value_hash is null)
+                    FROM entries AS e WHERE collection = ? AND value_hash is not null ORDER BY accessed""", [collection_name])
+                keys = select_evicted(c, count, size, max_bytes, max_entries, ttl, time.time())
+                c.executemany("DELETE FROM entries WHERE collection = ? AND key = ?",
+                              [(collection_name, key) for key in keys])
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+                raise
+            if keys:
+                # execute() would step the pragma only once (freeing a single page)
+                self.conn.executescript("PRAGMA incremental_vacuum")
+            return len(keys)
+        return self.executor.submit(_helper).result()
+
+    def entry_summaries(self, collection, filter=None):
+        conditions, params = _filter_to_sql(filter)
+        conditions.insert(0, "collection = {}".format(_quote_string(collection.name)))
         def _helper():
             c = self.conn.cursor()
-            r = c.execute("SELECT key, config, length(value), value_repr, created FROM entries WHERE collection = ?", [collection.name])
+            r = c.execute("SELECT key, config, value_size, value_repr, created FROM entries WHERE {}".format(" AND ".join(conditions)), params)
             return [
                 {"key": key, "config": pickle.loads(config), "size": value_size + len(config) if value_size else len(config), "value_repr": value_repr, "created": created}
                 for key, config, value_size, value_repr, created in r.fetchall()
@@ -300,6 +733,6 @@ class DB:
         def _helper():
             c = self.conn.cursor()
             c.execute("""UPDATE executors SET heartbeat = DATETIME('now'), stats = null WHERE id = ?""", [id])
-            c.execute("""DELETE FROM entries WHERE executor == ? AND value is null""", [id])
+            c.execute("""DELETE FROM entries WHERE executor == ? AND value_hash is null""", [id])
             self.conn.commit()
         self.executor.submit(_helper).result()
\ No newline at end of file
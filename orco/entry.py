@@ -1,14 +1,18 @@
+from . import serializers
 
 
 class Entry:
 
-    __slots__ = ("collection", "config", "value", "created")
+    __slots__ = ("collection", "config", "value", "created", "comp_time", "value_size")
 
-    def __init__(self, collection, config, value, created):
+    def __init__(self, collection, config, value, created, comp_time=None):
         self.collection = collection
         self.config = config
         self.value = value
         self.created = created
+        self.comp_time = comp_time
+        # Size of the serialized value in bytes, set by the backend when the value is stored (None when unknown)
+        self.value_size = None
 
     @property
     def value_repr(self):
@@ -19,4 +23,28 @@ class Entry:
 
     @property
     def is_computed(self):
-        return bool(self.created)
\ No newline at end of file
+        return bool(self.created)
+
+
+class LazyEntry(Entry):
+
+    """Entry whose value is deserialized on the first access"""
+
+    __slots__ = ("_data",)
+
+    def __init__(self, collection, config, data, created):
+        super().__init__(collection, config, None, created)
+        self._data = data
+        self.value_size = len(data)
+
+    @property
+    def value(self):
+        if self._data is not None:
+            Entry.value.__set__(self, serializers.loads(self._data))
+            self._data = None
+        return Entry.value.__get__(self)
+
+    @value.setter
+    def value(self, value):
+        self._data = None
+        Entry.value.__set__(self, value)
@@ -0,0 +1,69 @@
+import collections
+import threading
+
+
+class Subscription:
+
+    """
+    Queue of events for one subscriber; when the subscriber falls behind by
+    more than 'max_size' events, queued events are replaced by a single
+    {"type": "reset"} event (the subscriber has to reload everything)
+    """
+
+    def __init__(self, max_size, filter=None):
+        self.max_size = max_size
+        self.filter = filter
+        self.events = collections.deque()
+        self.condition = threading.Condition()
+
+    def push(self, event):
+        if self.filter is not None and not self.filter(event):
+            return
+        with self.condition:
+            if len(self.events) >= self.max_size:
+                self.events.clear()
+                event = {"type": "reset"}
+            self.events.append(event)
+            self.condition.notify()
+
+    def pop_all(self, timeout=None):
+        """Returns all queued events; waits up to 'timeout' seconds when there are none"""
+        with self.condition:
+            if not self.events:
+                self.condition.wait(timeout)
+            result = list(self.events)
+            self.events.clear()
+            return result
+
+
+class EventHub:
+
+    """
+    Fan-out of change events (finished and removed entries, executor updates)
+    to subscribers, e.g. event streams of the REST service
+    """
+
+    def __init__(self, max_queue_size=10000):
+        self.max_queue_size = max_queue_size
+        self.subscriptions = set()
+        self.lock = threading.Lock()
+
+    @property
+    def has_subscribers(self):
+        return bool(self.subscriptions)
+
+    def subscribe(self, filter=None):
+        subscription = Subscription(self.max_queue_size, filter)
+        with self.lock:
+            self.subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            self.subscriptions.discard(subscription)
+
+    def publish(self, event):
+        with self.lock:
+            subscriptions = list(self.subscriptions)
+        for subscription in subscriptions:
+            subscription.push(event)
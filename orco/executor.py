@@ -1,11 +1,24 @@
 from typing import Union, Iterable
 
 from .collection import Ref, Collection, Entry
-from .task import Task
+from .task import Task, Failure
+from .sharedmem import SharedValue, load_shared_value, close_segments
+from .trace import trace_span
+from .workers import WorkerPool
 from datetime import datetime
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
+import cloudpickle
+import heapq
+import itertools
+import logging
 import multiprocessing
+import os
+import pickle
 import threading
 import time
+import traceback
+
+logger = logging.getLogger(__name__)
 
 
 class Executor:
@@ -27,6 +40,21 @@ class Executor:
     def run(self, tasks: [Task]):
         raise NotImplementedError
 
+    def current_session(self):
+        """
+        Returns the run (session) whose build function is executed by the calling thread
+        or None when it is called outside of build functions
+        """
+        return None
+
+    def claim_tasks(self, tasks: [Task], session):
+        """
+        Takes over tasks of 'session' that were not started yet, so they can be computed
+        by a compute called from a build function of the session. Either all tasks
+        are claimed or none of them (False is returned).
+        """
+        return False
+
     def start(self):
         pass
 
@@ -43,14 +71,138 @@ def gather_announcements(tasks):
     result = set()
 
 
+def build_values(build_fn, build_fn_many, with_inputs, configs, inputs, extra_args=()):
+    """
+    Builds values for configs of one collection; inputs contains
+    a list of input entries (or None) for each config. 'extra_args'
+    (the result of init_fn) are appended to arguments of build functions.
+    """
+    if build_fn_many is not None:
+        values = build_fn_many(configs, inputs if with_inputs else None, *extra_args)
+        if len(values) != len(configs):
+            raise Exception("build_fn_many returned {} values for {} configs".format(len(values), len(configs)))
+        return values
+    assert len(configs) == 1
+    if with_inputs:
+        return [build_fn(configs[0], inputs[0], *extra_args)]
+    else:
+        return [build_fn(configs[0], *extra_args)]
+
+
+# State of a worker process: loaded build functions, results of init functions
+# and shared memory segments that could not be closed yet
+_worker_functions = {}
+_worker_states = {}
+_worker_segments = []
+
+
+def _load_function(fn_data):
+    fn = _worker_functions.get(fn_data)
+    if fn is None:
+        fn = cloudpickle.loads(fn_data)
+        _worker_functions[fn_data] = fn
+    return fn
+
+
+def build_in_process(fn_data, init_data, batched, with_inputs, configs, inputs):
+    """
+    Runs build_values in a worker process; inputs contain (config, created, SharedValue.descriptor)
+    for each input. Input entries in worker processes have 'collection' set to None.
+    The init function (init_data) is called once per worker and its result is kept.
+    Returns pickled values, the start and the end of the build and the pid of the worker.
+    """
+    global _worker_segments
+    fn = _load_function(fn_data)
+    extra_args = ()
+    if init_data is not None:
+        if init_data not in _worker_states:
+            _worker_states[init_data] = _load_function(init_data)()
+        extra_args = (_worker_states[init_data],)
+
+    segments = []
+    try:
+        inputs = [[Entry(None, c, load_shared_value(descriptor, segments), created)
+                   for c, created, descriptor in task_inputs] if task_inputs is not None else None
+                  for task_inputs in inputs]
+        start = time.time()
+        if batched:
+            values = build_values(None, fn, with_inputs, configs, inputs, extra_args)
+        else:
+            values = build_values(fn, None, with_inputs, configs, inputs, extra_args)
+        end = time.time()
+        # Values have to be serialized before segments of inputs are closed
+        return pickle.dumps(values), start, end, os.getpid()
+    finally:
+        inputs = None
+        values = None
+        if segments or _worker_segments:
+            _worker_segments = close_segments(_worker_segments + segments)
+
+
+class InlinePool:
+    """
+    Runs submitted functions immediately in the calling thread; used by runs
+    started from a build function, whose worker cannot wait for other workers
+    """
+
+    def submit(self, fn, *args):
+        future = Future()
+        try:
+            future.set_result(fn(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+
 class LocalExecutor(Executor):
 
     _debug_do_not_start_heartbeat = False
 
-    def __init__(self, heartbeat_interval=5):
+    def __init__(self, heartbeat_interval=5, n_workers=1, n_retries=0, retry_delay=1.0, retry_backoff=2.0,
+                 processes=False, shared_memory_threshold=64 * 1024,
+                 max_tasks_per_worker=None, max_worker_memory=None):
+        """
+        A failed build_fn is retried up to 'n_retries' times; the k-th retry
+        is started 'retry_delay * retry_backoff ** (k - 1)' seconds after the failure.
+
+        With 'processes', build functions run in 'n_workers' worker processes
+        (kept until the executor is stopped) instead of threads. Each input value
+        is pickled once per run; its buffers larger than 'shared_memory_threshold'
+        bytes are passed to workers through shared memory without copying.
+        A worker process is replaced after 'max_tasks_per_worker' builds or when its
+        resident memory exceeds 'max_worker_memory' bytes (checked only where the current
+        resident memory can be read from /proc).
+
+        Results of init_fn of collections are kept by each worker process
+        (by the executor when threads are used) and reused in later runs.
+
+        A run started from a build function (a nested compute) builds its tasks
+        in the thread of the calling build function. Tasks of the calling run that were
+        not started yet are built by the nested run; other unfinished tasks of running
+        sessions cannot be awaited by the nested run (an exception is raised).
+        """
         super().__init__("local", "0.0", "{} cpus".format(multiprocessing.cpu_count()), heartbeat_interval)
         self.heartbeat_thread = None
         self.heartbeat_stop_event = None
+        assert n_workers >= 1
+        assert n_retries >= 0
+        self.n_workers = n_workers
+        self.n_retries = n_retries
+        self.retry_delay = retry_delay
+        self.retry_backoff = retry_backoff
+        self.processes = processes
+        self.shared_memory_threshold = shared_memory_threshold
+        self.max_tasks_per_worker = max_tasks_per_worker
+        self.max_worker_memory = max_worker_memory
+        self.process_pool = None
+        self.thread_pool = None
+        self.init_states = {}
+        self.init_lock = threading.Lock()
+        # Runs (compute sessions) in progress; they share the pool of workers
+        self.n_sessions = 0
+        self.session_lock = threading.Lock()
+        # Session of the build function that is executed by a thread
+        self.worker_local = threading.local()
 
     def get_stats(self):
         return {}
@@ -58,6 +210,12 @@ class LocalExecutor(Executor):
     def stop(self):
         if self.heartbeat_stop_event:
             self.heartbeat_stop_event.set()
+        if self.process_pool:
+            self.process_pool.shutdown()
+            self.process_pool = None
+        if self.thread_pool:
+            self.thread_pool.shutdown()
+            self.thread_pool = None
         self.runtime.unregister_executor(self)
         self.runtime = None
 
@@ -70,42 +228,330 @@ class LocalExecutor(Executor):
             self.heartbeat_thread.daemon = True
             self.heartbeat_thread.start()
 
-    def run_task(self, task, input_entries):
-        ref = task.ref
-        if task.is_computed:
-            entry = ref.collection.get_entry(ref.config)
-            assert entry is not None
-            return entry
+    def run_tasks(self, tasks, inputs, tracer=None, session=None):
+        """
+        Builds tasks of one collection (a batch for collections with build_fn_many) and stores results;
+        'tracer' is the tracer of the run (worker threads are traced on its behalf), 'session' identifies
+        the run for computes called from the build function
+        """
+        with self.runtime.tracing(tracer):
+            collection = tasks[0].ref.collection
+            configs = [task.ref.config for task in tasks]
+            extra_args = (self._init_state(collection),) if collection.init_fn is not None else ()
+            start = time.time()
+            outer_session = self.current_session()
+            self.worker_local.session = session
+            try:
+                with trace_span(tracer, "build", "build", collection=collection.name, n_tasks=len(tasks)):
+                    values = build_values(collection.build_fn, collection.build_fn_many,
+                                          collection.dep_fn is not None, configs, inputs, extra_args)
+            finally:
+                self.worker_local.session = outer_session
+            comp_time = (time.time() - start) / len(tasks)
+            return self._store_values(tasks, values, comp_time)
 
-        collection = ref.collection
-        if collection.dep_fn is None:
-            value = collection.build_fn(ref.config)
-        else:
-            value = collection.build_fn(ref.config, input_entries)
-        entry = Entry(collection, ref.config, value, datetime.now())
-        collection.runtime.db.set_entry_value(self.id, entry)
-        self.stats["n_completed"] += 1
-        collection.runtime.db.update_stats(self.id, self.stats)
-        return entry
-
-    def run(self, all_tasks, required_tasks: [Task]):
-
-        def run_helper(task):
-            entry = cache.get(task)
-            if entry is not None:
-                return entry
-            if task.inputs:
-                inputs = [run_helper(task) for task in task.inputs]
-            else:
-                inputs = None
-            entry = self.run_task(task, inputs)
-            cache[task] = entry
+    def current_session(self):
+        return getattr(self.worker_local, "session", None)
+
+    def claim_tasks(self, tasks, session):
+        with self.session_lock:
+            if any(t.session is not session or t.started or t.claimed for t in tasks):
+                return False
+            for t in tasks:
+                t.claimed = True
+            return True
+
+    def _init_state(self, collection):
+        with self.init_lock:
+            if collection.init_fn not in self.init_states:
+                with trace_span(self.runtime.tracer, "init_fn", "build", collection=collection.name):
+                    self.init_states[collection.init_fn] = collection.init_fn()
+            return self.init_states[collection.init_fn]
+
+    def _store_values(self, tasks, values, comp_time):
+        created = datetime.now()
+        entries = [Entry(task.ref.collection, task.ref.config, value, created, comp_time)
+                   for task, value in zip(tasks, values)]
+        self.runtime.db.set_entry_values(self.id, entries)
+        self.runtime.publish_entries(entries)
+        return entries
+
+    def _get_thread_pool(self):
+        with self.session_lock:
+            if self.thread_pool is None:
+                self.thread_pool = ThreadPoolExecutor(max_workers=self.n_workers)
+            return self.thread_pool
+
+    def _session_quota(self):
+        # Workers are split evenly between concurrent runs
+        return max(1, -(-self.n_workers // max(1, self.n_sessions)))
+
+    def _add_stats(self, **counts):
+        with self.session_lock:
+            for name, count in counts.items():
+                self.stats[name] += count
+            stats = dict(self.stats)
+        self.runtime.update_stats(self.id, stats)
+
+    def _get_process_pool(self):
+        with self.session_lock:
+            if self.process_pool is None:
+                self.process_pool = WorkerPool(self.n_workers,
+                                               max_tasks=self.max_tasks_per_worker,
+                                               max_memory=self.max_worker_memory)
+            return self.process_pool
+
+    def _store_process_result(self, tasks, result):
+        data, start, end, pid = result
+        tracer = self.runtime.tracer
+        if tracer is not None:
+            tracer.add_span("build", start, end, "build",
+                            {"collection": tasks[0].ref.collection.name, "n_tasks": len(tasks)},
+                            pid=pid, tid=pid, thread_name="worker {}".format(pid))
+        with trace_span(tracer, "unpickle", "pickle", size=len(data)):
+            values = pickle.loads(data)
+        return self._store_values(tasks, values, (end - start) / len(tasks))
+
+    def run(self, all_tasks, required_tasks: [Task], keep_going=False):
+        """
+        Computes tasks in up to 'n_workers' threads (or worker processes). From tasks whose inputs
+        are finished, the one with the highest priority (the longest estimated
+        path to the end of the computation) is started first.
+
+        Without 'keep_going', the first failure (after retries) is raised.
+        With 'keep_going', announcements of the failed task and of all tasks
+        that depend on it are released, independent tasks are still computed
+        and Failure is returned in place of the entry of each failed task.
+
+        More runs may be in progress at once; they share workers of the executor
+        evenly. Results of tasks with 'in_flight' (computed by another run) are
+        awaited, results of tasks with 'future' are published through it.
+        A run started from a build function (see current_session) builds its tasks
+        inline and it is not counted among the runs that share workers.
+        """
+        entries = {}
+        waiting = {}
+        consumers = {}
+        attempts = {}
+        ready = []
+        delayed = []
+        counter = itertools.count()
+        # Values of inputs published for worker processes and numbers
+        # of their consumers that have not finished yet
+        shared = {}
+        remaining = {}
+        build_fns = {}
+        # Futures of tasks computed by other runs
+        external = {task.in_flight: task for task in all_tasks.values() if task.in_flight is not None}
+        tracer = self.runtime.tracer
+        # Identifies the run in its tasks and in threads running its build functions
+        session = object()
+        nested = self.current_session() is not None
+
+        def push_ready(task):
+            heapq.heappush(ready, (-task.priority, next(counter), task))
+
+        def consumer_finished(task):
+            for t in set(task.inputs or ()):
+                remaining[t] -= 1
+                if remaining[t] == 0 and t in shared:
+                    shared.pop(t).release()
+
+        def take_batch():
+            task = heapq.heappop(ready)[2]
+            collection = task.ref.collection
+            if collection.build_fn_many is None or not ready:
+                return [task]
+            same = sorted(item for item in ready if item[2].ref.collection is collection)
+            same = same[:collection.batch_size - 1]
+            if same:
+                taken = set(item[2] for item in same)
+                ready[:] = [item for item in ready if item[2] not in taken]
+                heapq.heapify(ready)
+            return [task] + [item[2] for item in same]
+
+        def start_batch(batch):
+            # Tasks claimed by a nested run are awaited as tasks of another run
+            with self.session_lock:
+                for task in batch:
+                    if not task.claimed:
+                        task.started = True
+            for task in batch:
+                if task.claimed:
+                    external[task.future] = task
+            return [task for task in batch if not task.claimed]
+
+        def shared_input(t):
+            entry = get_entry(t)
+            value = shared.get(t)
+            if value is None:
+                with trace_span(tracer, "share input", "pickle"):
+                    value = SharedValue(entry.value, self.shared_memory_threshold)
+                shared[t] = value
+            return entry.config, entry.created, value.descriptor
+
+        def submit(pool, batch):
+            collection = batch[0].ref.collection
+            if not self.processes:
+                inputs = [[get_entry(t) for t in task.inputs] if task.inputs else None for task in batch]
+                return pool.submit(self.run_tasks, batch, inputs, tracer, session)
+            batched = collection.build_fn_many is not None
+            fn_data = build_fns.get(collection.name)
+            if fn_data is None:
+                with trace_span(tracer, "pickle build_fn", "pickle"):
+                    fn_data = (cloudpickle.dumps(collection.build_fn_many if batched else collection.build_fn),
+                               cloudpickle.dumps(collection.init_fn) if collection.init_fn is not None else None)
+                build_fns[collection.name] = fn_data
+            inputs = [[shared_input(t) for t in task.inputs] if task.inputs else None for task in batch]
+            return pool.submit(build_in_process, fn_data[0], fn_data[1], batched, collection.dep_fn is not None,
+                               [task.ref.config for task in batch], inputs)
+
+        def finished(task, entry):
+            entries[task] = entry
+            if task.future is not None and not task.future.done():
+                task.future.set_result(entry)
+            consumer_finished(task)
+            for t in consumers.get(task, ()):
+                waiting[t] -= 1
+                if waiting[t] == 0:
+                    push_ready(t)
+
+        def fail(task, error):
+            failure = Failure(task.ref, error,
+                              "".join(traceback.format_exception(type(error), error, error.__traceback__)),
+                              attempts.get(task, 0))
+            entries[task] = failure
+            failed = [task]
+            stack = [task]
+            while stack:
+                for t in consumers.get(stack.pop(), ()):
+                    if t not in entries:
+                        entries[t] = Failure(t.ref, failure.error, attempts=0, failed_input=failure)
+                        failed.append(t)
+                        stack.append(t)
+            # Announcements are released before futures are failed, otherwise
+            # a concurrent run could find the announcement of a failed task
+            own = [t for t in failed if t.in_flight is None and not t.claimed]
+            self.runtime.db.unannounce_entries(self.id, [t.ref.ref_key() for t in own])
+            for t in failed:
+                consumer_finished(t)
+                if t.future is not None and not t.future.done():
+                    t.future.set_exception(failure.error)
+            for t in own:
+                self.runtime.publish_removed(t.ref.collection.name, [t.ref.ref_key()[1]])
+            self._add_stats(n_failed=len(own))
+
+        def get_entry(task):
+            entry = entries.get(task)
+            if entry is None:
+                assert task.is_computed
+                entry = task.ref.collection.get_entry(task.ref.config)
+                assert entry is not None
+                entries[task] = entry
             return entry
 
-        n_tasks = sum(1 for t in all_tasks.values() if not t.is_computed)
-        self.stats = {
-            "n_tasks": n_tasks,
-            "n_completed": 0
-        }
-        cache = {}
-        return [run_helper(task) for task in required_tasks]
\ No newline at end of file
+        for task in all_tasks.values():
+            if task.is_computed or task.in_flight is not None:
+                continue
+            inputs = set(t for t in task.inputs or () if not t.is_computed)
+            waiting[task] = len(inputs)
+            for t in inputs:
+                consumers.setdefault(t, []).append(task)
+            if not inputs:
+                push_ready(task)
+            for t in set(task.inputs or ()):
+                remaining[t] = remaining.get(t, 0) + 1
+
+        with self.session_lock:
+            for task in waiting:
+                task.session = session
+            if not nested:
+                if self.n_sessions == 0:
+                    self.stats = {
+                        "n_tasks": 0,
+                        "n_completed": 0,
+                        "n_failed": 0,
+                    }
+                self.n_sessions += 1
+            # Claimed tasks are already counted by the outer run
+            self.stats["n_tasks"] += sum(1 for task in waiting if task.claimed_task is None)
+
+        running = {}
+        if nested:
+            pool = InlinePool()
+        elif self.processes:
+            pool = self._get_process_pool()
+        else:
+            pool = self._get_thread_pool()
+        try:
+            while ready or running or delayed or external:
+                now = time.time()
+                while delayed and delayed[0][0] <= now:
+                    push_ready(heapq.heappop(delayed)[2])
+                while ready and (nested or len(running) < self._session_quota()):
+                    batch = start_batch(take_batch())
+                    if not batch:
+                        continue
+                    for task in batch:
+                        attempts[task] = attempts.get(task, 0) + 1
+                    running[submit(pool, batch)] = batch
+                timeout = max(0, delayed[0][0] - now) if delayed else None
+                if not running and not external:
+                    time.sleep(timeout)
+                    continue
+                done, _ = wait(list(running) + list(external), timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    task = external.pop(future, None)
+                    if task is not None:
+                        error = future.exception()
+                        if error is None:
+                            finished(task, future.result())
+                        elif keep_going:
+                            fail(task, error)
+                        else:
+                            raise error
+                        continue
+                    batch = running.pop(future)
+                    error = future.exception()
+                    if error is None and self.processes:
+                        try:
+                            batch_entries = self._store_process_result(batch, future.result())
+                        except Exception as e:
+                            error = e
+                    elif error is None:
+                        batch_entries = future.result()
+                    if error is not None:
+                        for task in batch:
+                            if attempts[task] <= self.n_retries:
+                                delay = self.retry_delay * self.retry_backoff ** (attempts[task] - 1)
+                                logger.warning("Task %s failed (attempt %s), retrying in %ss: %r",
+                                               task, attempts[task], delay, error)
+                                heapq.heappush(delayed, (time.time() + delay, next(counter), task))
+                            elif keep_going:
+                                logger.warning("Task %s failed: %r", task, error)
+                                fail(task, error)
+                            else:
+                                raise error
+                        continue
+                    for task, entry in zip(batch, batch_entries):
+                        finished(task, entry)
+                    self._add_stats(n_completed=len(batch))
+        except BaseException as e:
+            for future in running:
+                future.cancel()
+            if not self.processes:
+                wait(running)
+            # Release announcements of the tasks that will not be computed
+            unfinished = [t for t in waiting if t not in entries]
+            self.runtime.db.unannounce_entries(self.id, [t.ref.ref_key() for t in unfinished])
+            for t in unfinished:
+                if t.future is not None and not t.future.done():
+                    t.future.set_exception(e)
+            raise
+        finally:
+            for value in shared.values():
+                value.release()
+            if not nested:
+                with self.session_lock:
+                    self.n_sessions -= 1
+        return [get_entry(task) for task in required_tasks]
\ No newline at end of file
@@ -0,0 +1,652 @@
+import json
+import math
+import pickle
+import struct
+import tempfile
+import time
+
+import lmdb
+from collections import namedtuple
+
+from .backend import Backend, select_evicted, serialize_value
+from . import serializers
+from .entry import Entry
+from .query import parse_filter, match_config, check_field, config_fields
+
+
+def _entry_id(collection_name, key):
+    return "{}\0{}\0".format(collection_name, key).encode()
+
+
+def _split_entry_id(entry_id):
+    collection_name, key, _ = entry_id.decode().split("\0")
+    return collection_name, key
+
+
+def _executor_id(id):
+    return struct.pack(">Q", id)
+
+
+def _index_prefix(collection_name, field):
+    return "{}\0{}\0".format(collection_name, field).encode()
+
+
+def _encode_index_value(value):
+    """
+    Order-preserving encoding of a scalar value of a config field; numbers
+    (and booleans) are ordered before strings as in SQLite
+    """
+    if isinstance(value, str):
+        # Terminated so a shorter string is ordered first, zero bytes are escaped
+        return b"\x02" + value.encode("utf-8", "surrogatepass").replace(b"\x00", b"\x00\xff") + b"\x00\x00"
+    try:
+        number = float(value) + 0.0  # -0.0 is encoded as 0.0
+    except OverflowError:
+        number = math.inf if value > 0 else -math.inf
+    data = bytearray(struct.pack(">d", number))
+    if data[0] & 0x80:
+        data = bytearray(b ^ 0xff for b in data)
+    else:
+        data[0] |= 0x80
+    return b"\x01" + bytes(data)
+
+
+def _index_key_entry_id(k, prefix_size):
+    if k[prefix_size] == 1:
+        return k[prefix_size + 9:]
+    return k[k.index(b"\x00\x00", prefix_size) + 2:]
+
+
+Record = namedtuple("Record", ["config", "value_hash", "value_size", "value_repr", "created", "executor", "accessed",
+                               "version"])
+
+
+def _load_record(data):
+    return Record(*pickle.loads(data))
+
+
+def _dump_record(record):
+    return pickle.dumps(tuple(record))
+
+
+class LmdbDB(Backend):
+
+    """
+    Backend in an embedded memory-mapped key-value store (LMDB)
+
+    Reads do not go through a DB thread and do not take any locks,
+    writes are serialized by LMDB itself (also between processes).
+    Pages freed by removed entries are reused by LMDB, the file never shrinks.
+
+    Databases:
+        collections: name -> json (build history, version)
+        entries: entry_id -> pickled Record (config is pickled, value is in blobs)
+        blobs: content hash -> pickled value
+        blob_refs: content hash -> (number of entries with the value, size)
+        deps: entry_id(input) + entry_id(output) -> b"" (kept until the output is removed)
+        rdeps: entry_id(output) + entry_id(input) -> b""
+        announced: executor_id + entry_id -> b"" (placeholders of executors)
+        executors: executor_id -> json
+        dep_cache: entry_id -> pickled [(collection name, config)] (memoized dep_fn)
+        index: collection + field + encoded value + entry_id -> b"" (indexes of config fields)
+
+    Fields in 'indexes' of a collection are indexed for all its entries (also placeholders);
+    find() and entry_summaries() read only entries selected by the first condition on
+    an indexed field (other than '!=' and None), remaining conditions are checked on them.
+    """
+
+    def __init__(self, path, map_size=2 ** 36):
+        if path == ":memory:":
+            self.tmpdir = tempfile.TemporaryDirectory(prefix="orco-lmdb-")
+            path = self.tmpdir.name
+        else:
+            self.tmpdir = None
+        self.env = lmdb.open(path, map_size=map_size, max_dbs=16)
+        self.collections = self.env.open_db(b"collections")
+        self.entries = self.env.open_db(b"entries")
+        self.deps = self.env.open_db(b"deps")
+        self.rdeps = self.env.open_db(b"rdeps")
+        self.announced = self.env.open_db(b"announced")
+        self.executors = self.env.open_db(b"executors")
+        self.meta = self.env.open_db(b"meta")
+        self.dep_cache = self.env.open_db(b"dep_cache")
+        self.blobs = self.env.open_db(b"blobs")
+        self.blob_refs = self.env.open_db(b"blob_refs")
+        self.index = self.env.open_db(b"index")
+
+    def close(self):
+        self.env.close()
+        if self.tmpdir:
+            self.tmpdir.cleanup()
+
+    def _read_entry(self, txn, collection_name, key):
+        data = txn.get(_entry_id(collection_name, key), db=self.entries)
+        if data is None:
+            return None
+        return _load_record(data)
+
+    def _is_executor_live(self, txn, executor_id, now):
+        data = txn.get(_executor_id(executor_id), db=self.executors)
+        if data is None:
+            return False
+        record = json.loads(data)
+        return record["heartbeat"] + record["heartbeat_interval"] * 2 >= now
+
+    def _is_visible(self, txn, record, now):
+        return record.value_hash is not None or record.executor is None \
+            or self._is_executor_live(txn, record.executor, now)
+
+    def _record_size(self, record):
+        return len(record.config) + (record.value_size or 0)
+
+    def _add_blob_ref(self, txn, value_hash, data):
+        refs = txn.get(value_hash, db=self.blob_refs)
+        if refs is None:
+            txn.put(value_hash, data, db=self.blobs)
+            refcount = 0
+        else:
+            refcount = struct.unpack(">QQ", refs)[0]
+        txn.put(value_hash, struct.pack(">QQ", refcount + 1, len(data)), db=self.blob_refs)
+
+    def _remove_blob_ref(self, txn, value_hash):
+        refcount, size = struct.unpack(">QQ", txn.get(value_hash, db=self.blob_refs))
+        if refcount == 1:
+            txn.delete(value_hash, db=self.blob_refs)
+            txn.delete(value_hash, db=self.blobs)
+        else:
+            txn.put(value_hash, struct.pack(">QQ", refcount - 1, size), db=self.blob_refs)
+
+    def _load_value(self, txn, record):
+        return serializers.loads(txn.get(record.value_hash, db=self.blobs))
+
+    def _prefix_keys(self, txn, db, prefix):
+        cursor = txn.cursor(db=db)
+        if not cursor.set_range(prefix):
+            return []
+        result = []
+        for k in cursor.iternext(values=False):
+            if not k.startswith(prefix):
+                break
+            result.append(k)
+        return result
+
+    def _collection_indexes(self, txn, collection_name):
+        data = txn.get(collection_name.encode(), db=self.collections)
+        return json.loads(data).get("indexes", []) if data is not None else []
+
+    def _index_keys(self, collection_name, entry_id, config_data, fields):
+        return [_index_prefix(collection_name, field) + _encode_index_value(value) + entry_id
+                for field, value in config_fields(pickle.loads(config_data), fields).items()]
+
+    def _add_to_index(self, txn, collection_name, entry_id, config_data, fields):
+        if fields:
+            for k in self._index_keys(collection_name, entry_id, config_data, fields):
+                txn.put(k, b"", db=self.index)
+
+    def _delete_entry(self, txn, entry_id):
+        data = txn.pop(entry_id, db=self.entries)
+        if data is None:
+            return
+        record = _load_record(data)
+        collection_name = _split_entry_id(entry_id)[0]
+        fields = self._collection_indexes(txn, collection_name)
+        if fields:
+            for k in self._index_keys(collection_name, entry_id, record.config, fields):
+                txn.delete(k, db=self.index)
+        if record.executor is not None:
+            txn.delete(_executor_id(record.executor) + entry_id, db=self.announced)
+        if record.value_hash is not None:
+            self._remove_blob_ref(txn, record.value_hash)
+        # Edges to outputs are kept, so outputs can be found as stale when the version changes
+        for k in self._prefix_keys(txn, self.rdeps, entry_id):
+            txn.delete(k, db=self.rdeps)
+            txn.delete(k[len(entry_id):] + entry_id, db=self.deps)
+
+    def _delete_announced(self, txn, executor_id):
+        prefix = _executor_id(executor_id)
+        for k in self._prefix_keys(txn, self.announced, prefix):
+            entry_id = k[len(prefix):]
+            data = txn.get(entry_id, db=self.entries)
+            if data is not None and _load_record(data).value_hash is None:
+                self._delete_entry(txn, entry_id)
+            else:
+                txn.delete(k, db=self.announced)
+
+    def _cleanup_lost_entries(self, txn):
+        now = time.time()
+        cursor = txn.cursor(db=self.executors)
+        for k, v in list(cursor):
+            record = json.loads(v)
+            if record["heartbeat"] + record["heartbeat_interval"] * 2 < now:
+                self._delete_announced(txn, struct.unpack(">Q", k)[0])
+
+    def ensure_collection(self, name, indexes=(), version=None):
+        if "\0" in name:
+            raise Exception("Invalid collection name")
+        with self.env.begin(write=True) as txn:
+            txn.put(name.encode(), json.dumps({"build_count": 0, "build_time": 0, "version": None}).encode(),
+                    overwrite=False, db=self.collections)
+            info = json.loads(txn.get(name.encode(), db=self.collections))
+            new_indexes = [check_field(field) for field in indexes if field not in info.get("indexes", [])]
+            if new_indexes:
+                for key, record in self._iter_collection(txn, name):
+                    self._add_to_index(txn, name, _entry_id(name, key), record.config, new_indexes)
+                info["indexes"] = info.get("indexes", []) + new_indexes
+                txn.put(name.encode(), json.dumps(info).encode(), db=self.collections)
+            if version is None or info.get("version") == version:
+                return 0
+            removed = self._remove_stale(txn, name, version)
+            for k in self._prefix_keys(txn, self.dep_cache, "{}\0".format(name).encode()):
+                txn.delete(k, db=self.dep_cache)
+            info["version"] = version
+            txn.put(name.encode(), json.dumps(info).encode(), db=self.collections)
+            return removed
+
+    def _remove_stale(self, txn, name, version):
+        stack = [_entry_id(name, key) for key, record in self._iter_collection(txn, name)
+                 if record.value_hash is not None and record.version != version]
+        # Outputs of removed inputs were computed from an older version
+        prefix = "{}\0".format(name).encode()
+        for k in self._prefix_keys(txn, self.deps, prefix):
+            end = k.index(b"\0", len(prefix)) + 1
+            entry_id = k[:end]
+            data = txn.get(entry_id, db=self.entries)
+            if data is None or _load_record(data).value_hash is None:
+                stack.append(entry_id)
+        stale = set(stack)
+        while stack:
+            entry_id = stack.pop()
+            for k in self._prefix_keys(txn, self.deps, entry_id):
+                output_id = k[len(entry_id):]
+                if output_id not in stale:
+                    stale.add(output_id)
+                    stack.append(output_id)
+        removed = 0
+        for entry_id in stale:
+            data = txn.get(entry_id, db=self.entries)
+            # Placeholders of running computations are kept, their executors remove them on failure
+            if data is not None and _load_record(data).value_hash is not None:
+                self._delete_entry(txn, entry_id)
+                removed += 1
+        return removed
+
+    def create_entry(self, entry):
+        collection = entry.collection
+        value_hash, data = serialize_value(entry.value, entry.collection.serializer)
+        entry.value_size = len(data)
+        record = Record(pickle.dumps(entry.config),
+                        value_hash,
+                        len(data),
+                        entry.value_repr,
+                        str(entry.created),
+                        None,
+                        time.time(),
+                        collection.version)
+        entry_id = _entry_id(collection.name, collection.make_key(entry.config))
+        with self.env.begin(write=True) as txn:
+            if not txn.put(entry_id, _dump_record(record), overwrite=False, db=self.entries):
+                raise Exception("Entry already exists: {}/{}".format(collection.name, entry.config))
+            self._add_blob_ref(txn, value_hash, data)
+            self._add_to_index(txn, collection.name, entry_id, record.config,
+                               self._collection_indexes(txn, collection.name))
+
+    def set_entry_value(self, executor_id, entry):
+        self.set_entry_values(executor_id, [entry])
+
+    def set_entry_values(self, executor_id, entries):
+        now = time.time()
+        with self.env.begin(write=True) as txn:
+            for entry in entries:
+                collection = entry.collection
+                key = collection.make_key(entry.config)
+                entry_id = _entry_id(collection.name, key)
+                record = self._read_entry(txn, collection.name, key)
+                if record is None or record.value_hash is not None or record.executor != executor_id:
+                    raise Exception("Setting value to unannouced config: {}/{}".format(entry.collection.name, entry.config))
+                value_hash, data = serialize_value(entry.value, entry.collection.serializer)
+                entry.value_size = len(data)
+                self._add_blob_ref(txn, value_hash, data)
+                record = record._replace(value_hash=value_hash,
+                                         value_size=len(data),
+                                         value_repr=entry.value_repr,
+                                         created=str(entry.created),
+                                         accessed=now,
+                                         version=collection.version)
+                txn.put(entry_id, _dump_record(record), db=self.entries)
+                txn.delete(_executor_id(executor_id) + entry_id, db=self.announced)
+                if entry.comp_time is not None:
+                    name = collection.name.encode()
+                    info = json.loads(txn.get(name, db=self.collections))
+                    info["build_count"] += 1
+                    info["build_time"] += entry.comp_time
+                    txn.put(name, json.dumps(info).encode(), db=self.collections)
+
+    def get_build_times(self):
+        result = {}
+        with self.env.begin() as txn:
+            for name, data in txn.cursor(db=self.collections):
+                info = json.loads(data)
+                if info["build_count"] > 0:
+                    result[name.decode()] = info["build_time"] / info["build_count"]
+        return result
+
+    def get_entry_by_config(self, collection, config):
+        with self.env.begin() as txn:
+            record = self._read_entry(txn, collection.name, collection.make_key(config))
+            if record is None or not self._is_visible(txn, record, time.time()):
+                return None
+            value = self._load_value(txn, record) if record.value_hash is not None else None
+        return Entry(collection, config, value, record.created)
+
+    def has_entry_by_key(self, collection, key):
+        with self.env.begin() as txn:
+            record = self._read_entry(txn, collection.name, key)
+        return record is not None and record.value_hash is not None
+
+    def get_entries(self, collection, keys):
+        result = []
+        with self.env.begin() as txn:
+            for key in keys:
+                record = self._read_entry(txn, collection.name, key)
+                if record is None or record.value_hash is None:
+                    result.append(None)
+                else:
+                    result.append((txn.get(record.value_hash, db=self.blobs), record.created))
+        return result
+
+    def has_entries(self, collection, keys):
+        with self.env.begin() as txn:
+            result = []
+            for key in keys:
+                record = self._read_entry(txn, collection.name, key)
+                result.append(record is not None and record.value_hash is not None)
+        return result
+
+    def get_entry_state(self, collection, key):
+        with self.env.begin() as txn:
+            record = self._read_entry(txn, collection.name, key)
+            if record is None or not self._is_visible(txn, record, time.time()):
+                return None
+        return "finished" if record.value_hash is not None else "announced"
+
+    def get_entry_states(self, ref_keys):
+        result = []
+        now = time.time()
+        with self.env.begin() as txn:
+            for collection_name, key in ref_keys:
+                record = self._read_entry(txn, collection_name, key)
+                if record is None or not self._is_visible(txn, record, now):
+                    result.append(None)
+                else:
+                    result.append("finished" if record.value_hash is not None else "announced")
+        return result
+
+    def get_cached_deps(self, ref_keys):
+        with self.env.begin() as txn:
+            result = [txn.get(_entry_id(*ref_key), db=self.dep_cache) for ref_key in ref_keys]
+        return [pickle.loads(data) if data is not None else None for data in result]
+
+    def set_cached_deps(self, items):
+        with self.env.begin(write=True) as txn:
+            for ref_key, deps in items:
+                txn.put(_entry_id(*ref_key), pickle.dumps(deps), db=self.dep_cache)
+
+    def clear_cached_deps(self, collection_name):
+        with self.env.begin(write=True) as txn:
+            for k in self._prefix_keys(txn, self.dep_cache, "{}\0".format(collection_name).encode()):
+                txn.delete(k, db=self.dep_cache)
+
+    def remove_entry_by_key(self, collection, key):
+        with self.env.begin(write=True) as txn:
+            self._delete_entry(txn, _entry_id(collection.name, key))
+
+    def remove_entries(self, collection_key_pairs):
+        with self.env.begin(write=True) as txn:
+            for collection_name, key in collection_key_pairs:
+                self._delete_entry(txn, _entry_id(collection_name, key))
+
+    def announce_entries(self, executor_id, refs, deps=()):
+        with self.env.begin(write=True) as txn:
+            self._cleanup_lost_entries(txn)
+
+        with self.env.begin(write=True) as txn:
+            indexes = {}
+            for r in refs:
+                name = r.collection.name
+                entry_id = _entry_id(name, r.collection.make_key(r.config))
+                record = Record(pickle.dumps(r.config), None, None, None, None, executor_id, None, None)
+                if not txn.put(entry_id, _dump_record(record), overwrite=False, db=self.entries):
+                    txn.abort()
+                    return False
+                txn.put(_executor_id(executor_id) + entry_id, b"", db=self.announced)
+                if name not in indexes:
+                    indexes[name] = self._collection_indexes(txn, name)
+                self._add_to_index(txn, name, entry_id, record.config, indexes[name])
+            for r1, r2 in deps:
+                id1 = _entry_id(*r1.ref_key())
+                id2 = _entry_id(*r2.ref_key())
+                if txn.get(id1, db=self.entries) is None or txn.get(id2, db=self.entries) is None \
+                        or not txn.put(id1 + id2, b"", overwrite=False, db=self.deps):
+                    txn.abort()
+                    return False
+                txn.put(id2 + id1, b"", db=self.rdeps)
+            return True
+
+    def unannounce_entries(self, executor_id, ref_keys):
+        with self.env.begin(write=True) as txn:
+            for collection_name, key in ref_keys:
+                record = self._read_entry(txn, collection_name, key)
+                if record is not None and record.value_hash is None and record.executor == executor_id:
+                    self._delete_entry(txn, _entry_id(collection_name, key))
+
+    def _iter_collection(self, txn, collection_name, after_key=None):
+        prefix = "{}\0".format(collection_name).encode()
+        cursor = txn.cursor(db=self.entries)
+        start = _entry_id(collection_name, after_key) if after_key is not None else prefix
+        if not cursor.set_range(start):
+            return
+        for k, v in cursor:
+            if not k.startswith(prefix):
+                break
+            if k == start and after_key is not None:
+                continue
+            yield _split_entry_id(k)[1], _load_record(v)
+
+    def _index_scan(self, txn, collection_name, field, op, value):
+        prefix = _index_prefix(collection_name, field)
+        cursor = txn.cursor(db=self.index)
+        if op in ("==", "in"):
+            # Equal values (e.g. 1 and 1.0) have the same encoding
+            ranges = [(prefix + _encode_index_value(v), prefix + _encode_index_value(v))
+                      for v in (value if op == "in" else [value])]
+        elif op in (">", ">="):
+            ranges = [(prefix + _encode_index_value(value), prefix)]
+        else:
+            ranges = [(prefix, prefix + _encode_index_value(value))]
+        # Bounds are inclusive (distinct large integers may share an encoding),
+        # the condition itself is checked on loaded entries
+        entry_ids = set()
+        for start, end in ranges:
+            if not cursor.set_range(start):
+                continue
+            for k in cursor.iternext(values=False):
+                if not k.startswith(prefix) or k[:len(end)] > end:
+                    break
+                entry_ids.add(_index_key_entry_id(k, len(prefix)))
+        return entry_ids
+
+    def _iter_matching(self, txn, collection_name, conditions):
+        """
+        Iterates over (key, record) of entries that may match conditions;
+        entries are selected by an index when a condition allows it
+        """
+        indexes = self._collection_indexes(txn, collection_name)
+        for field, op, value in conditions:
+            if field in indexes and op != "!=" and value is not None \
+                    and (op != "in" or all(v is not None for v in value)):
+                break
+        else:
+            yield from self._iter_collection(txn, collection_name)
+            return
+        for entry_id in sorted(self._index_scan(txn, collection_name, field, op, value)):
+            data = txn.get(entry_id, db=self.entries)
+            if data is not None:
+                yield _split_entry_id(entry_id)[1], _load_record(data)
+
+    def find_entries(self, collection, filter):
+        conditions = parse_filter(filter)
+        result = []
+        with self.env.begin() as txn:
+            for key, record in self._iter_matching(txn, collection.name, conditions):
+                if record.value_hash is None:
+                    continue
+                config = pickle.loads(record.config)
+                if match_config(conditions, config):
+                    result.append(Entry(collection, config, self._load_value(txn, record), record.created))
+        return result
+
+    def export_entries(self, collection_name, after_key=None, limit=1000):
+        result = []
+        with self.env.begin() as txn:
+            for key, record in self._iter_collection(txn, collection_name, after_key):
+                if record.value_hash is None:
+                    continue
+                result.append((key, record.config, txn.get(record.value_hash, db=self.blobs),
+                               record.value_repr, record.created))
+                if len(result) >= limit:
+                    break
+        return result
+
+    def update_access_times(self, accessed):
+        with self.env.begin(write=True) as txn:
+            for collection_name, key, t in accessed:
+                entry_id = _entry_id(collection_name, key)
+                data = txn.get(entry_id, db=self.entries)
+                if data is None:
+                    continue
+                record = _load_record(data)
+                if record.accessed is None or record.accessed < t:
+                    txn.put(entry_id, _dump_record(record._replace(accessed=t)), db=self.entries)
+
+    def _is_input_of_unfinished(self, txn, entry_id):
+        for k in self._prefix_keys(txn, self.deps, entry_id):
+            data = txn.get(k[len(entry_id):], db=self.entries)
+            if data is not None and _load_record(data).value_hash is None:
+                return True
+        return False
+
+    def evict_entries(self, collection_name, max_bytes=None, max_entries=None, ttl=None):
+        with self.env.begin(write=True) as txn:
+            finished = [(key, self._record_size(record), record.accessed or 0)
+                        for key, record in self._iter_collection(txn, collection_name)
+                        if record.value_hash is not None]
+            finished.sort(key=lambda x: x[2])
+            candidates = ((key, size, accessed,
+                           self._is_input_of_unfinished(txn, _entry_id(collection_name, key)))
+                          for key, size, accessed in finished)
+            keys = select_evicted(candidates, len(finished), sum(x[1] for x in finished),
+                                  max_bytes, max_entries, ttl, time.time())
+            for key in keys:
+                self._delete_entry(txn, _entry_id(collection_name, key))
+        return len(keys)
+
+    def change_counter(self):
+        return self.env.info()["last_txnid"]
+
+    def collection_summaries(self):
+        result = []
+        with self.env.begin() as txn:
+            names = [k.decode() for k in txn.cursor(db=self.collections).iternext(values=False)]
+            for name in names:
+                count = 0
+                size = 0
+                physical_size = 0
+                hashes = set()
+                for key, record in self._iter_collection(txn, name):
+                    count += 1
+                    size += self._record_size(record)
+                    physical_size += len(record.config)
+                    if record.value_hash is not None and record.value_hash not in hashes:
+                        hashes.add(record.value_hash)
+                        physical_size += record.value_size
+                result.append({"name": name, "count": count, "size": size, "physical_size": physical_size})
+        return result
+
+    def entry_summaries(self, collection, filter=None):
+        conditions = parse_filter(filter)
+        result = []
+        with self.env.begin() as txn:
+            for key, record in self._iter_matching(txn, collection.name, conditions):
+                config = pickle.loads(record.config)
+                if match_config(conditions, config):
+                    result.append({"key": key,
+                                   "config": config,
+                                   "size": self._record_size(record),
+                                   "value_repr": record.value_repr,
+                                   "created": record.created})
+        return result
+
+    def register_executor(self, executor):
+        assert executor.id is None
+        record = {"created": str(executor.created),
+                  "heartbeat": time.time(),
+                  "heartbeat_interval": executor.heartbeat_interval,
+                  "stats": executor.get_stats(),
+                  "type": executor.executor_type,
+                  "version": executor.version,
+                  "resources": executor.resources}
+        with self.env.begin(write=True) as txn:
+            id = struct.unpack(">Q", txn.get(b"executor_id", struct.pack(">Q", 0), db=self.meta))[0] + 1
+            txn.put(b"executor_id", struct.pack(">Q", id), db=self.meta)
+            txn.put(_executor_id(id), json.dumps(record).encode(), db=self.executors)
+        executor.id = id
+
+    def executor_summaries(self):
+        now = time.time()
+        result = []
+        with self.env.begin() as txn:
+            for k, v in txn.cursor(db=self.executors):
+                record = json.loads(v)
+                if record["stats"] is None:
+                    status = "stopped"
+                elif record["heartbeat"] + record["heartbeat_interval"] * 2 >= now:
+                    status = "running"
+                else:
+                    status = "lost"
+                result.append({"id": struct.unpack(">Q", k)[0],
+                               "created": record["created"],
+                               "status": status,
+                               "stats": record["stats"],
+                               "type": record["type"],
+                               "version": record["version"],
+                               "resources": record["resources"]})
+        return result
+
+    def _update_executor(self, id, fn):
+        with self.env.begin(write=True) as txn:
+            data = txn.get(_executor_id(id), db=self.executors)
+            if data is None:
+                return
+            record = json.loads(data)
+            fn(record)
+            txn.put(_executor_id(id), json.dumps(record).encode(), db=self.executors)
+
+    def update_heartbeat(self, id):
+        def _update(record):
+            if record["stats"] is not None:
+                record["heartbeat"] = time.time()
+        self._update_executor(id, _update)
+
+    def update_stats(self, id, stats):
+        def _update(record):
+            record["stats"] = stats
+            record["heartbeat"] = time.time()
+        self._update_executor(id, _update)
+
+    def stop_executor(self, id):
+        def _update(record):
+            record["stats"] = None
+            record["heartbeat"] = time.time()
+        self._update_executor(id, _update)
+        with self.env.begin(write=True) as txn:
+            self._delete_announced(txn, id)
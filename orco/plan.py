@@ -0,0 +1,92 @@
+
+
+class Plan:
+
+    """
+    Graph of tasks needed to compute requested refs (not announced in DB)
+
+    Durations of tasks are estimated from the average build time of their
+    collections; collections without any history are estimated as 0.
+
+    Attributes:
+        tasks: dict (collection name, key) -> Task
+        requested_tasks: tasks of requested refs (in the order of refs)
+        deps: pairs of refs (input, output) of tasks that will be computed
+        collections: collection name -> {"computed", "to_compute", "build_time"}
+        total_time: estimated time of computing all tasks one by one
+        critical_path: the longest chain of tasks that has to be computed sequentially
+        critical_path_time: estimated duration of critical_path
+    """
+
+    def __init__(self, tasks, requested_tasks, deps, build_times):
+        self.tasks = tasks
+        self.requested_tasks = requested_tasks
+        self.deps = deps
+
+        self.collections = {}
+        for task in tasks.values():
+            name = task.ref.collection.name
+            info = self.collections.get(name)
+            if info is None:
+                info = {"computed": 0, "to_compute": 0, "build_time": build_times.get(name)}
+                self.collections[name] = info
+            if task.is_computed:
+                info["computed"] += 1
+            else:
+                info["to_compute"] += 1
+                task.duration = info["build_time"] or 0
+
+        self.total_time = sum(task.duration for task in tasks.values())
+        self.critical_path = self._compute_priorities()
+        self.critical_path_time = sum(task.duration for task in self.critical_path)
+
+    @property
+    def n_tasks(self):
+        return len(self.tasks)
+
+    @property
+    def n_to_compute(self):
+        return sum(1 for task in self.tasks.values() if not task.is_computed)
+
+    def _topological_order(self):
+        order = []
+        visited = set()
+        for root in self.tasks.values():
+            if root in visited:
+                continue
+            visited.add(root)
+            stack = [(root, iter(root.inputs or ()))]
+            while stack:
+                task, inputs = stack[-1]
+                for t in inputs:
+                    if t not in visited:
+                        visited.add(t)
+                        stack.append((t, iter(t.inputs or ())))
+                        break
+                else:
+                    stack.pop()
+                    order.append(task)
+        return order
+
+    def _compute_priorities(self):
+        consumers = {task: [] for task in self.tasks.values()}
+        for task in self.tasks.values():
+            for t in task.inputs or ():
+                consumers[t].append(task)
+
+        for task in reversed(self._topological_order()):
+            task.priority = task.duration + max((t.priority for t in consumers[task]), default=0)
+
+        pending = [task for task in self.tasks.values() if not task.is_computed]
+        if not pending:
+            return []
+        task = max(pending, key=lambda t: t.priority)
+        path = [task]
+        while consumers[task]:
+            task = max(consumers[task], key=lambda t: t.priority)
+            path.append(task)
+        return path
+
+    def __repr__(self):
+        return "<Plan tasks={} to_compute={} total_time={:.2f}s critical_path_time={:.2f}s>".format(
+            self.n_tasks, self.n_to_compute, self.total_time, self.critical_path_time)
@@ -0,0 +1,147 @@
+import json
+import re
+
+field_pattern = re.compile("^[A-Za-z_][A-Za-z0-9_]*(\\.[A-Za-z_][A-Za-z0-9_]*)*$")
+
+OPERATORS = ("==", "!=", "<", "<=", ">", ">=", "in")
+
+
+def check_field(field):
+    if not isinstance(field, str) or not field_pattern.match(field):
+        raise Exception("Invalid field name in filter: '{}'".format(field))
+    return field
+
+
+def check_value(value):
+    if value is not None and not isinstance(value, (bool, int, float, str)):
+        raise Exception("Invalid value in filter: {!r} (only scalar values are allowed)".format(value))
+    return value
+
+
+def parse_filter(filter):
+    """
+    Converts filter into a list of conditions (field, operator, value)
+
+    Filter is a dictionary that maps fields of config onto a value or
+    onto a dictionary {operator: value}. Nested fields are separated by dots.
+    Values have to be scalars (None, bool, number or string).
+
+    >>> parse_filter({"size": {">": 1000}, "algo": "x"})
+    [('size', '>', 1000), ('algo', '==', 'x')]
+    """
+    if filter is None:
+        return []
+    if not isinstance(filter, dict):
+        raise Exception("Filter has to be a dictionary")
+    result = []
+    for field, cond in filter.items():
+        check_field(field)
+        if isinstance(cond, dict):
+            for op, value in cond.items():
+                if op not in OPERATORS:
+                    raise Exception("Invalid operator in filter: '{}'".format(op))
+                if op == "in":
+                    if not isinstance(value, (list, tuple)):
+                        raise Exception("Operator 'in' needs a list")
+                    for v in value:
+                        check_value(v)
+                else:
+                    check_value(value)
+                result.append((field, op, value))
+        else:
+            result.append((field, "==", check_value(cond)))
+    return result
+
+
+def _key_part(obj):
+    if isinstance(obj, dict):
+        return {k: _key_part(v) for k, v in obj.items() if not (isinstance(k, str) and k.startswith("_"))}
+    if isinstance(obj, (list, tuple)):
+        return [_key_part(v) for v in obj]
+    return obj
+
+
+def config_to_json(config):
+    """
+    Returns JSON of the part of config that forms its key (fields starting
+    with '_' are omitted) or None when the config cannot be represented in JSON
+    (e.g. it contains NaN); such configs do not match any filter.
+    """
+    try:
+        return json.dumps(_key_part(config), allow_nan=False)
+    except (TypeError, ValueError):
+        return None
+
+
+def _get_field(obj, field):
+    for name in field.split("."):
+        if not isinstance(obj, dict):
+            return None
+        obj = obj.get(name)
+    if isinstance(obj, (list, dict)):
+        return None
+    return obj
+
+
+def _compare(a, op, b):
+    if op == "in":
+        return any(_compare(a, "==", v) for v in b)
+    if a is None or b is None:
+        return op == "==" and a is b
+    if isinstance(a, str) != isinstance(b, str):
+        # SQLite orders all numbers before all strings
+        a = isinstance(a, str)
+        b = isinstance(b, str)
+    if op == "==":
+        return a == b
+    if op == "!=":
+        return a != b
+    if op == "<":
+        return a < b
+    if op == "<=":
+        return a <= b
+    if op == ">":
+        return a > b
+    return a >= b
+
+
+def match_filter(conditions, config):
+    """
+    Evaluates conditions from parse_filter on a config without a database.
+    Follows the semantics of SQLite json_extract (tuples are lists,
+    missing fields are NULL; lists and dicts do not match any value).
+    """
+    for field, op, value in conditions:
+        if value is None and op == "!=":
+            if _get_field(config, field) is None:
+                return False
+        elif not _compare(_get_field(config, field), op, value):
+            return False
+    return True
+
+
+def config_fields(config, fields):
+    """
+    Returns values of fields of a config as they are seen by filters
+    (see match_config); fields without a scalar value are omitted
+    """
+    config_json = config_to_json(config)
+    if config_json is None:
+        return {}
+    config = json.loads(config_json)
+    result = {}
+    for field in fields:
+        value = _get_field(config, field)
+        if value is not None:
+            result[field] = value
+    return result
+
+
+def match_config(conditions, config):
+    """
+    Evaluates conditions on a config as it is stored in config_json by SQLite
+    """
+    if not conditions:
+        return True
+    config_json = config_to_json(config)
+    return config_json is not None and match_filter(conditions, json.loads(config_json))
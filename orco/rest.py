@@ -1,19 +1,97 @@
 
 
-from flask import Flask, request, current_app
-from flask_restful import Resource, Api
+from flask import Flask, Response, request, current_app
+from flask_restful import Resource, Api, abort
 from flask_cors import CORS
+from collections import OrderedDict
+import gzip
+import hashlib
 import json
+import threading
+import time
+
+from .query import parse_filter
 
 app = Flask(__name__)
 cors = CORS(app)
 api = Api(app)
 
+CACHE_SIZE = 128
+GZIP_MIN_SIZE = 1024
+KEEPALIVE_INTERVAL = 15
+
+
+class ResponseCache:
+
+    """
+    Serialized JSON responses keyed by the request; a response is reused
+    while the change counter of the DB stays the same (and it is not older
+    than 'max_age' seconds when given)
+    """
+
+    def __init__(self, size=CACHE_SIZE):
+        self.size = size
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, version, max_age=None):
+        with self.lock:
+            item = self.items.get(key)
+            if item is None or item["version"] != version:
+                return None
+            if max_age is not None and item["time"] + max_age < time.time():
+                return None
+            self.items.move_to_end(key)
+            return item
+
+    def put(self, key, version, body):
+        item = {"version": version,
+                "time": time.time(),
+                "body": body,
+                "etag": hashlib.sha1(body).hexdigest(),
+                "gzip": gzip.compress(body) if len(body) >= GZIP_MIN_SIZE else None}
+        with self.lock:
+            self.items[key] = item
+            self.items.move_to_end(key)
+            while len(self.items) > self.size:
+                self.items.popitem(last=False)
+        return item
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+
+
+cache = ResponseCache()
+
+
+def cached_json(compute, max_age=None):
+    """
+    Returns JSON of compute() from the cache when possible; supports
+    If-None-Match (304 for an unchanged ETag) and gzip encoding
+    """
+    version = current_app.runtime.db.change_counter()
+    key = request.full_path
+    item = cache.get(key, version, max_age)
+    if item is None:
+        item = cache.put(key, version, json.dumps(compute()).encode())
+
+    if item["gzip"] is not None and "gzip" in request.accept_encodings:
+        response = Response(item["gzip"], mimetype="application/json")
+        response.headers["Content-Encoding"] = "gzip"
+        response.set_etag(item["etag"] + "-gzip")
+    else:
+        response = Response(item["body"], mimetype="application/json")
+        response.set_etag(item["etag"])
+    response.vary.add("Accept-Encoding")
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
 
 class Collections(Resource):
 
     def get(self):
-        return current_app.runtime.collection_summaries()
+        return cached_json(current_app.runtime.collection_summaries)
 
 api.add_resource(Collections, '/collections')
 
@@ -21,7 +99,14 @@ api.add_resource(Collections, '/collections')
 class Entries(Resource):
 
     def get(self, collection_name):
-        return current_app.runtime.entry_summaries(collection_name)
+        filter = request.args.get("filter")
+        if filter is not None:
+            try:
+                filter = json.loads(filter)
+                parse_filter(filter)
+            except Exception as e:
+                abort(400, message="Invalid filter: {}".format(e))
+        return cached_json(lambda: current_app.runtime.entry_summaries(collection_name, filter))
 
 
 api.add_resource(Entries, '/entries/<string:collection_name>')
@@ -30,12 +115,45 @@ api.add_resource(Entries, '/entries/<string:collection_name>')
 class Executors(Resource):
 
     def get(self):
-        return current_app.runtime.executor_summaries()
+        # Status of an executor also depends on the time of its last heartbeat
+        return cached_json(current_app.runtime.executor_summaries, max_age=1.0)
 
 
 api.add_resource(Executors, '/executors')
 
 
+@app.route("/events")
+def events():
+    """
+    Stream of changes as server-sent events; with '?collection=<name>' entry
+    events of other collections are skipped
+    """
+    hub = current_app.runtime.events
+    collection_name = request.args.get("collection")
+    if collection_name is not None:
+        subscription = hub.subscribe(lambda e: e.get("collection", collection_name) == collection_name)
+    else:
+        subscription = hub.subscribe()
+
+    def generate():
+        try:
+            yield "retry: 2000\n\n"
+            while True:
+                events = subscription.pop_all(KEEPALIVE_INTERVAL)
+                if not events:
+                    yield ": keep-alive\n\n"
+                for event in events:
+                    yield "event: {}\ndata: {}\n\n".format(event["type"], json.dumps(event))
+        finally:
+            hub.unsubscribe(subscription)
+
+    response = Response(generate(), mimetype="text/event-stream")
+    response.cache_control.no_cache = True
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
+
 def init_service(runtime):
     app.runtime = runtime
+    cache.clear()
     return app
\ No newline at end of file
@@ -1,26 +1,53 @@
-from .db import DB
+from .backend import create_backend
 from .collection import Collection, Ref
+from .events import EventHub
 from .executor import Executor, LocalExecutor, Task
+from .plan import Plan
+from .trace import Tracer, TracedBackend, trace_span
 
 
+from concurrent.futures import Future
+from contextlib import contextmanager
 import cloudpickle
 import argparse
 import threading
 import logging
+import pickle
+import time
 
 logger = logging.getLogger(__name__)
 
 
+def evictor(runtime, event, interval):
+    while not event.wait(interval):
+        try:
+            removed = runtime.evict()
+            logger.debug("Evictor removed %s entries", removed)
+        except Exception:
+            logger.exception("Eviction failed")
+
+
 class Runtime:
 
-    def __init__(self, db_path, executor: Executor=None):
-        self.db = DB(db_path)
+    def __init__(self, db_path, executor: Executor=None, backend="sqlite"):
+        self._backend = create_backend(backend, db_path)
+        # Tracers of threads inside trace()
+        self._local = threading.local()
 
         self._executor = executor
         self._collections = {}
         self._lock = threading.Lock()
+        # Planning and announcing of compute sessions is serialized by _compute_lock;
+        # _in_flight maps ref keys of tasks computed by running sessions to these tasks
+        self._compute_lock = threading.Lock()
+        self._in_flight = {}
+        self._access_log = {}
+        self._access_lock = threading.Lock()
+        self._evictor_stop_event = None
+        self._evictor_thread = None
 
         self.executors = []
+        self.events = EventHub()
 
         logging.debug("Starting runtime %s (db=%s)", self, db_path)
 
@@ -29,9 +56,50 @@ class Runtime:
 
     def stop(self):
         logger.debug("Stopping runtime %s", self)
-        for executor in self.executors:
+        self.stop_evictor()
+        for executor in list(self.executors):
             logger.debug("Stopping executor %s", executor)
             executor.stop()
+        self.db.close()
+
+    @property
+    def db(self):
+        """Backend; calls from a thread inside trace() are recorded by its tracer"""
+        tracer = self.tracer
+        if tracer is None:
+            return self._backend
+        return TracedBackend(self._backend, tracer)
+
+    @db.setter
+    def db(self, backend):
+        self._backend = backend
+
+    @property
+    def tracer(self):
+        """Tracer of the current thread (None when it is not traced)"""
+        return getattr(self._local, "tracer", None)
+
+    @contextmanager
+    def tracing(self, tracer):
+        """Sets the tracer of the current thread for the block (e.g. in worker threads of a traced computation)"""
+        previous = self.tracer
+        self._local.tracer = tracer
+        try:
+            yield tracer
+        finally:
+            self._local.tracer = previous
+
+    @contextmanager
+    def trace(self, tracer=None):
+        """
+        Records spans of computations (planning, DB calls, dep_fn, builds) started
+        by the current thread in the block; yields a Tracer that can be saved as Chrome trace JSON
+
+        Other threads (other compute sessions, the REST service, the evictor, heartbeats)
+        are not traced; blocks may be nested.
+        """
+        with self.tracing(tracer if tracer is not None else Tracer()) as tracer:
+            yield tracer
 
     def register_executor(self, executor):
         logger.debug("Registering executor %s", executor)
@@ -44,13 +112,52 @@ class Runtime:
         logger.debug("Unregistering executor %s", executor)
         self.executors.remove(executor)
         self.db.stop_executor(executor.id)
+        self.events.publish({"type": "executor", "id": executor.id, "status": "stopped"})
+
+    def register_collection(self, name, build_fn=None, dep_fn=None, indexes=(),
+                            max_bytes=None, max_entries=None, ttl=None, cache_deps=False,
+                            build_fn_many=None, batch_size=64, version=None, init_fn=None,
+                            serializer="pickle"):
+        """
+        Registers a collection
+
+        Limits 'max_bytes', 'max_entries' and 'ttl' (seconds since the last access)
+        are enforced by Runtime.evict(), least recently accessed entries are removed first.
+
+        When 'cache_deps' is True, results of dep_fn are memoized in DB (by config)
+        and dep_fn is not called again for the same config, even in later runs.
 
-    def register_collection(self, name, build_fn=None, dep_fn=None):
+        'build_fn_many(configs, inputs)' may be used instead of build_fn; it gets
+        up to 'batch_size' configs (and a list of input entries for each config
+        when the collection has dep_fn, otherwise None) and returns a list of values.
+
+        Entries are stamped with 'version' (e.g. a version of build_fn); when it changes,
+        entries built with another version and entries that (transitively) depend
+        on them are removed, entries of other collections are kept.
+
+        'init_fn()' does an expensive setup (e.g. loads a model); it is called once per worker
+        and its result is passed to build_fn (or build_fn_many) as the last argument.
+
+        'serializer' stores values of the collection: "pickle" (default), "json",
+        "marshal" (fast binary format for builtin types), "array" (raw buffers
+        of NumPy arrays) or a name/instance of a serializer registered by
+        orco.serializers.register_serializer. The format is stored with each value,
+        so entries written with another serializer remain readable.
+        """
+        if version is not None:
+            version = str(version)
         with self._lock:
             if name in self._collections:
                 raise Exception("Collection already registered")
-            self.db.ensure_collection(name)
-            collection = Collection(self, name, build_fn=build_fn, dep_fn=dep_fn)
+            removed = self.db.ensure_collection(name, indexes, version)
+            if removed:
+                logger.info("Collection %s changed version to %s, %s stale entries removed", name, version, removed)
+                self.events.publish({"type": "reset"})
+            collection = Collection(self, name, build_fn=build_fn, dep_fn=dep_fn, indexes=indexes,
+                                    max_bytes=max_bytes, max_entries=max_entries, ttl=ttl,
+                                    cache_deps=cache_deps, build_fn_many=build_fn_many,
+                                    batch_size=batch_size, version=version, init_fn=init_fn,
+                                    serializer=serializer)
             self._collections[name] = collection
             return collection
 
@@ -62,14 +169,87 @@ class Runtime:
     def collection_summaries(self):
         return self.db.collection_summaries()
 
-    def entry_summaries(self, collection_name):
-        return self.db.entry_summaries(self.collections[collection_name])
+    def freeze(self, path, collection_names=None):
+        """
+        Writes finished entries of collections (all by default) into an immutable
+        snapshot file; Runtime(path, backend="snapshot") serves lookups from it read-only
+        """
+        from .snapshot import write_snapshot
+        if collection_names is None:
+            collection_names = [c["name"] for c in self.db.collection_summaries()]
+        write_snapshot(self.db, path, collection_names)
+
+    def entry_summaries(self, collection_name, filter=None):
+        return self.db.entry_summaries(self.collections[collection_name], filter)
 
     def executor_summaries(self):
         return self.db.executor_summaries()
 
+    def record_access(self, collection, config):
+        # Access times are buffered in memory and written into DB before eviction
+        key = (collection.name, collection.make_key(config))
+        with self._access_lock:
+            self._access_log[key] = time.time()
+
+    def evict(self):
+        """Removes entries of collections that exceed their limits, returns the number of removed entries"""
+        with self._access_lock:
+            access_log, self._access_log = self._access_log, {}
+        if access_log:
+            self.db.update_access_times([(name, key, t) for (name, key), t in access_log.items()])
+        removed = 0
+        for collection in self.collections.values():
+            if collection.has_limits:
+                count = self.db.evict_entries(collection.name,
+                                              max_bytes=collection.max_bytes,
+                                              max_entries=collection.max_entries,
+                                              ttl=collection.ttl)
+                if count:
+                    self.events.publish({"type": "reset", "collection": collection.name})
+                removed += count
+        return removed
+
+    def start_evictor(self, interval=60):
+        """Starts a background thread that calls evict() every 'interval' seconds"""
+        if self._evictor_stop_event is not None:
+            raise Exception("Evictor is already running")
+        self._evictor_stop_event = threading.Event()
+        self._evictor_thread = threading.Thread(target=evictor, args=(self, self._evictor_stop_event, interval))
+        self._evictor_thread.daemon = True
+        self._evictor_thread.start()
+
+    def stop_evictor(self):
+        if self._evictor_stop_event is not None:
+            self._evictor_stop_event.set()
+            self._evictor_thread.join()
+            self._evictor_stop_event = None
+            self._evictor_thread = None
+
     def update_heartbeat(self, id):
         self.db.update_heartbeat(id)
+        self.events.publish({"type": "executor", "id": id, "status": "running"})
+
+    def update_stats(self, id, stats):
+        self.db.update_stats(id, stats)
+        self.events.publish({"type": "executor", "id": id, "status": "running", "stats": dict(stats)})
+
+    def publish_entries(self, entries):
+        """Publishes stored entries to subscribers of events"""
+        if not self.events.has_subscribers:
+            return
+        for entry in entries:
+            config = pickle.dumps(entry.config)
+            self.events.publish({"type": "entry",
+                                 "collection": entry.collection.name,
+                                 "key": entry.collection.make_key(entry.config),
+                                 "config": entry.config,
+                                 "size": len(config) + (entry.value_size or 0),
+                                 "value_repr": entry.value_repr,
+                                 "created": str(entry.created)})
+
+    def publish_removed(self, collection_name, keys):
+        if keys and self.events.has_subscribers:
+            self.events.publish({"type": "removed", "collection": collection_name, "keys": list(keys)})
 
     def serve(self, port=8550, debug=False, testing=False):
         from .rest import init_service
@@ -90,42 +270,152 @@ class Runtime:
         p.set_default(func=self._command_serve)
         return parser.parse_args()
 
-    def compute_refs(self, refs):
+    def _get_deps(self, refs):
+        result = [None] * len(refs)
+        cached = [i for i, ref in enumerate(refs) if ref.collection.cache_deps]
+        if cached:
+            collections = self.collections
+            for i, deps in zip(cached, self.db.get_cached_deps([refs[i].ref_key() for i in cached])):
+                if deps is not None and all(name in collections for name, config in deps):
+                    result[i] = [collections[name].ref(config) for name, config in deps]
+
+        new_cached_deps = []
+        for i, ref in enumerate(refs):
+            if result[i] is None:
+                with trace_span(self.tracer, "dep_fn", "build", collection=ref.collection.name):
+                    deps = list(ref.collection.dep_fn(ref.config))
+                result[i] = deps
+                if ref.collection.cache_deps:
+                    new_cached_deps.append((ref.ref_key(), [(r.collection.name, r.config) for r in deps]))
+        if new_cached_deps:
+            self.db.set_cached_deps(new_cached_deps)
+        return result
+
+    def _create_tasks(self, refs, session=None):
+        """
+        Creates tasks for refs and for all their (transitive) dependencies
+        that are not computed yet. The graph is explored level by level, so
+        states of a whole level are obtained from DB in one batch.
+
+        'session' is the run whose build function plans the computation;
+        its tasks that were not started yet are planned as claimed tasks
+        (see Executor.claim_tasks).
+        """
         tasks = {}
+        inputs = {}
         global_deps = []
 
-        def make_task(ref):
-            ref_key = ref.ref_key()
-            task = tasks.get(ref_key)
-            if task is not None:
-                return task
-            collection = ref.collection
-            state = self.db.get_entry_state(collection, ref_key[1])
-            if state == "announced":
-                raise Exception("Computation needs announced but not finished entries, it is not supported now: {}".format(ref))
-            if state is None and collection.dep_fn:
-                deps = collection.dep_fn(ref.config)
+        frontier = {}
+        for ref in refs:
+            frontier.setdefault(ref.ref_key(), ref)
+
+        while frontier:
+            ref_keys = []
+            expand = []
+            for ref_key, ref in frontier.items():
+                other = self._in_flight.get(ref_key)
+                future = other.future if other is not None else None
+                if future is None or (future.done() and future.exception() is not None):
+                    ref_keys.append(ref_key)
+                elif session is None or future.done():
+                    # Computed by a concurrent session, this session waits for its result
+                    task = Task(ref, None, False)
+                    task.in_flight = future
+                    tasks[ref_key] = task
+                elif other.session is session and not other.started and not other.claimed:
+                    # Waiting for the calling run would never finish, the task is built by this run
+                    task = Task(ref, None, False)
+                    task.claimed_task = other
+                    task.future = future
+                    tasks[ref_key] = task
+                    if ref.collection.dep_fn:
+                        expand.append((ref_key, ref))
+                else:
+                    raise Exception("Build function cannot wait for {}, it is being computed by another run"
+                                    .format(ref))
+            for ref_key, state in zip(ref_keys, self.db.get_entry_states(ref_keys)):
+                ref = frontier[ref_key]
+                if state == "announced":
+                    raise Exception("Computation needs announced but not finished entries, it is not supported now: {}".format(ref))
+                tasks[ref_key] = Task(ref, None, state is not None)
+                if state is None and ref.collection.dep_fn:
+                    expand.append((ref_key, ref))
+
+            frontier = {}
+            for (ref_key, ref), deps in zip(expand, self._get_deps([ref for _, ref in expand])):
+                dep_keys = []
                 for r in deps:
                     assert isinstance(r, Ref)
                     global_deps.append((r, ref))
-                inputs = [make_task(r) for r in deps]
-            else:
-                inputs = None
-            task = Task(ref, inputs, state is not None)
-            tasks[ref_key] = task
-            return task
+                    key = r.ref_key()
+                    dep_keys.append(key)
+                    if key not in tasks:
+                        frontier.setdefault(key, r)
+                inputs[ref_key] = dep_keys
+
+        for ref_key, dep_keys in inputs.items():
+            tasks[ref_key].inputs = [tasks[key] for key in dep_keys]
+
+        return tasks, [tasks[ref.ref_key()] for ref in refs], global_deps
+
+    def plan(self, refs):
+        """
+        Returns a Plan (graph of tasks with estimates) for computing refs,
+        nothing is announced or computed
+        """
+        return self._plan(refs)
+
+    def _plan(self, refs, session=None):
+        with trace_span(self.tracer, "plan", "runtime", n_refs=len(refs)):
+            tasks, requested_tasks, global_deps = self._create_tasks(refs, session)
+            return Plan(tasks, requested_tasks, global_deps, self.db.get_build_times())
 
+    def compute_refs(self, refs, keep_going=False):
+        """
+        Computes refs; may be called from more threads at once. A task that is
+        already being computed by another call is not computed again, the call
+        waits for its result.
+        """
         if len(self.executors) == 0:
             raise Exception("No executors registered")
         executor = self.executors[0]
 
-        requested_tasks = [make_task(ref) for ref in  refs]
-        need_to_compute_refs = [task.ref for task in tasks.values() if not task.is_computed]
-        logger.debug("Announcing refs %s at worker %s", need_to_compute_refs, executor.id)
-        if not self.db.announce_entries(executor.id, need_to_compute_refs, global_deps):
-            raise Exception("Was not able to announce task into DB")
+        with trace_span(self.tracer, "compute", "runtime", n_refs=len(refs)):
+            return self._compute_refs(executor, refs, keep_going)
 
-        return executor.run(tasks, requested_tasks)
+    def _compute_refs(self, executor, refs, keep_going):
+        with self._compute_lock:
+            plan = self._plan(refs, executor.current_session())
+            claimed_tasks = [task for task in plan.tasks.values() if task.claimed_task is not None]
+            if claimed_tasks and not executor.claim_tasks([task.claimed_task for task in claimed_tasks],
+                                                          executor.current_session()):
+                raise Exception("Tasks needed by the build function were started by another run")
+            own_tasks = [task for task in plan.tasks.values()
+                         if not task.is_computed and task.in_flight is None and task.claimed_task is None]
+            need_to_compute_refs = [task.ref for task in own_tasks]
+            logger.debug("Announcing refs %s at worker %s", need_to_compute_refs, executor.id)
+            # Dependencies of claimed tasks were announced by the outer run
+            claimed_keys = set(task.ref.ref_key() for task in claimed_tasks)
+            deps = [(r1, r2) for r1, r2 in plan.deps if r2.ref_key() not in claimed_keys]
+            if not self.db.announce_entries(executor.id, need_to_compute_refs, deps):
+                error = Exception("Was not able to announce task into DB")
+                for task in claimed_tasks:
+                    task.future.set_exception(error)
+                raise error
+            for task in own_tasks:
+                task.future = Future()
+                self._in_flight[task.ref.ref_key()] = task
+        try:
+            return executor.run(plan.tasks, plan.requested_tasks, keep_going=keep_going)
+        finally:
+            with self._compute_lock:
+                # Futures of claimed tasks are shared with the outer run, they are always finished here
+                for task in own_tasks + claimed_tasks:
+                    if not task.future.done():
+                        task.future.set_exception(Exception("Computation of {} was not finished".format(task.ref)))
+                    ref_key = task.ref.ref_key()
+                    if self._in_flight.get(ref_key) is task:
+                        del self._in_flight[ref_key]
 
     def main(self):
         self._parse_args()
\ No newline at end of file
@@ -0,0 +1,132 @@
+import json
+import marshal
+import pickle
+
+
+class Serializer:
+
+    """
+    Converts values of a collection into bytes and back
+
+    'name' is stored together with each value, so a value is always
+    loaded by the serializer that stored it.
+    """
+
+    name = None
+
+    def dumps(self, value):
+        raise NotImplementedError
+
+    def loads(self, data):
+        raise NotImplementedError
+
+
+class PickleSerializer(Serializer):
+
+    name = "pickle"
+
+    def dumps(self, value):
+        return pickle.dumps(value)
+
+    def loads(self, data):
+        return pickle.loads(data)
+
+
+class JsonSerializer(Serializer):
+
+    """JSON-like data (tuples are loaded as lists)"""
+
+    name = "json"
+
+    def dumps(self, value):
+        return json.dumps(value, separators=(",", ":")).encode()
+
+    def loads(self, data):
+        return json.loads(bytes(data))
+
+
+class MarshalSerializer(Serializer):
+
+    """Fast binary format for values built from builtin types (numbers, strings, lists, dicts, ...)"""
+
+    name = "marshal"
+
+    def dumps(self, value):
+        return marshal.dumps(value)
+
+    def loads(self, data):
+        return marshal.loads(data)
+
+
+class ArraySerializer(Serializer):
+
+    """
+    NumPy arrays stored as a raw buffer (with dtype and shape);
+    loaded arrays are read-only views of the stored data
+    """
+
+    name = "array"
+
+    def dumps(self, value):
+        import numpy as np
+        array = np.ascontiguousarray(value)
+        if array.dtype.hasobject:
+            raise Exception("Arrays of objects cannot be stored by the array serializer")
+        header = json.dumps({"dtype": array.dtype.str, "shape": array.shape}).encode()
+        return len(header).to_bytes(4, "little") + header + array.tobytes()
+
+    def loads(self, data):
+        import numpy as np
+        size = int.from_bytes(data[:4], "little")
+        header = json.loads(bytes(data[4:4 + size]))
+        return np.frombuffer(data, dtype=np.dtype(header["dtype"]), offset=4 + size).reshape(header["shape"])
+
+
+_serializers = {}
+
+
+def register_serializer(serializer):
+    """Registers a custom serializer; values stored by it can be loaded only when it is registered"""
+    if not serializer.name or "\0" in serializer.name:
+        raise Exception("Invalid serializer name: {!r}".format(serializer.name))
+    _serializers[serializer.name] = serializer
+
+
+for _serializer in (PickleSerializer(), JsonSerializer(), MarshalSerializer(), ArraySerializer()):
+    register_serializer(_serializer)
+
+
+def get_serializer(serializer):
+    """
+    Returns a registered serializer by its name; a Serializer instance is registered
+    (if its name is not registered yet) and returned
+    """
+    if isinstance(serializer, Serializer):
+        registered = _serializers.get(serializer.name)
+        if registered is None:
+            register_serializer(serializer)
+        elif type(registered) is not type(serializer):
+            raise Exception("Serializer name '{}' is already used by {}".format(
+                serializer.name, type(registered).__name__))
+        return serializer
+    result = _serializers.get(serializer)
+    if result is None:
+        raise Exception("Unknown serializer '{}'".format(serializer))
+    return result
+
+
+def dumps(value, serializer=None):
+    """
+    Serializes a value; the result of the pickle serializer is stored as it is
+    (it always starts with b"\\x80"), other formats are prefixed with b"\\0<name>\\0"
+    """
+    if serializer is None or serializer.name == "pickle":
+        return pickle.dumps(value)
+    return b"\0" + serializer.name.encode() + b"\0" + serializer.dumps(value)
+
+
+def loads(data):
+    if data[:1] != b"\0":
+        return pickle.loads(data)
+    end = bytes(data[:256]).index(b"\0", 1)
+    return get_serializer(bytes(data[1:end]).decode()).loads(memoryview(data)[end + 1:])
@@ -0,0 +1,86 @@
+import pickle
+from multiprocessing import shared_memory
+
+
+def _attach(name):
+    try:
+        # Python >= 3.13; the segment is owned (and unlinked) by the publisher
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+
+class SharedValue:
+
+    """
+    Value published for worker processes
+
+    The value is pickled with protocol 5; buffers larger than 'threshold'
+    bytes (e.g. NumPy arrays, bytearrays) are stored out-of-band, each in
+    its own shared memory segment. Workers get views into the segments
+    instead of copies. The publisher has to call release().
+    """
+
+    def __init__(self, value, threshold):
+        buffers = []
+
+        def buffer_callback(buffer):
+            if buffer.raw().nbytes < threshold:
+                return True
+            buffers.append(buffer)
+            return False
+
+        data = pickle.dumps(value, protocol=5, buffer_callback=buffer_callback)
+        self.segments = []
+        try:
+            for buffer in buffers:
+                raw = buffer.raw()
+                segment = shared_memory.SharedMemory(create=True, size=max(raw.nbytes, 1))
+                self.segments.append(segment)
+                segment.buf[:raw.nbytes] = raw
+        except BaseException:
+            self.release()
+            raise
+        self.descriptor = (data, [(segment.name, buffer.raw().nbytes)
+                                  for segment, buffer in zip(self.segments, buffers)])
+
+    @property
+    def size(self):
+        return sum(size for _, size in self.descriptor[1])
+
+    def release(self):
+        for segment in self.segments:
+            segment.close()
+            segment.unlink()
+        self.segments = []
+
+
+def load_shared_value(descriptor, opened_segments):
+    """
+    Loads value from SharedValue.descriptor; attached segments are appended
+    into 'opened_segments' and have to be closed by close_segments when the
+    value is no longer used.
+    """
+    data, segments = descriptor
+    if not segments:
+        return pickle.loads(data)
+    buffers = []
+    for name, size in segments:
+        segment = _attach(name)
+        opened_segments.append(segment)
+        buffers.append(segment.buf[:size].toreadonly())
+    return pickle.loads(data, buffers=buffers)
+
+
+def close_segments(segments):
+    """
+    Closes attached segments, returns segments that cannot be closed yet
+    because some of their views are still alive
+    """
+    still_open = []
+    for segment in segments:
+        try:
+            segment.close()
+        except BufferError:
+            still_open.append(segment)
+    return still_open
@@ -0,0 +1,268 @@
+import hashlib
+import json
+import mmap
+import os
+import pickle
+import struct
+
+from .backend import Backend
+from . import serializers
+from .entry import Entry
+from .query import parse_filter, match_config
+
+
+MAGIC = b"ORCOSNP1"
+
+# magic, offset of metadata (JSON), offset of the index, number of entries
+_HEADER = struct.Struct("<8sQQQ")
+_U32 = struct.Struct("<I")
+_U64 = struct.Struct("<Q")
+# offset and length of the value, lengths of id, config, value_repr and created
+_RECORD = struct.Struct("<QQIIII")
+
+
+def _entry_id(collection_name, key):
+    return "{}\0{}".format(collection_name, key).encode()
+
+
+def write_snapshot(backend, path, collection_names, batch_size=1000):
+    """
+    Writes finished entries of collections from 'backend' into an immutable snapshot file
+
+    Layout: header, values (each distinct value once), records, metadata and the index
+    (offsets of records sorted by (collection name, key)). The file is written
+    under a temporary name and then atomically renamed to 'path'.
+    """
+    tmp_path = "{}.tmp{}".format(path, os.getpid())
+    index = []
+    value_offsets = {}
+    collections = {}
+    with open(tmp_path, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, 0, 0, 0))
+        for name in collection_names:
+            info = {"count": 0, "size": 0, "physical_size": 0}
+            collections[name] = info
+            hashes = set()
+            after_key = None
+            while True:
+                rows = backend.export_entries(name, after_key, batch_size)
+                for key, config, value, value_repr, created in rows:
+                    value_hash = hashlib.sha256(value).digest()
+                    location = value_offsets.get(value_hash)
+                    if location is None:
+                        location = (f.tell(), len(value))
+                        f.write(value)
+                        value_offsets[value_hash] = location
+                    if value_hash not in hashes:
+                        hashes.add(value_hash)
+                        info["physical_size"] += len(value)
+                    entry_id = _entry_id(name, key)
+                    # SQLite may return value_repr converted into a number
+                    value_repr = str(value_repr).encode() if value_repr is not None else b""
+                    created = str(created).encode()
+                    index.append((entry_id, f.tell()))
+                    f.write(_RECORD.pack(location[0], location[1],
+                                         len(entry_id), len(config), len(value_repr), len(created)))
+                    f.write(entry_id)
+                    f.write(config)
+                    f.write(value_repr)
+                    f.write(created)
+                    info["count"] += 1
+                    info["size"] += len(config) + len(value)
+                    info["physical_size"] += len(config)
+                if len(rows) < batch_size:
+                    break
+                after_key = rows[-1][0]
+
+        meta_offset = f.tell()
+        meta = json.dumps({"collections": collections}).encode()
+        f.write(_U32.pack(len(meta)))
+        f.write(meta)
+        index.sort()
+        index_offset = f.tell()
+        for _, offset in index:
+            f.write(_U64.pack(offset))
+        f.seek(0)
+        f.write(_HEADER.pack(MAGIC, meta_offset, index_offset, len(index)))
+    os.replace(tmp_path, path)
+
+
+class SnapshotDB(Backend):
+
+    """
+    Read-only backend that serves finished entries from a snapshot file (see write_snapshot)
+
+    The file is memory-mapped and never changes, lookups are binary searches
+    in the sorted index and do not take any locks. All writes raise an exception.
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, meta_offset, self.index_offset, self.n_entries = _HEADER.unpack_from(self.mmap, 0)
+        if magic != MAGIC:
+            self.mmap.close()
+            raise Exception("'{}' is not an orco snapshot".format(path))
+        meta_size = _U32.unpack_from(self.mmap, meta_offset)[0]
+        start = meta_offset + _U32.size
+        self.meta = json.loads(self.mmap[start:start + meta_size])
+
+    def close(self):
+        self.mmap.close()
+
+    def _record_offset(self, i):
+        return _U64.unpack_from(self.mmap, self.index_offset + i * _U64.size)[0]
+
+    def _entry_id_at(self, offset):
+        id_size = _RECORD.unpack_from(self.mmap, offset)[2]
+        start = offset + _RECORD.size
+        return self.mmap[start:start + id_size]
+
+    def _lower_bound(self, entry_id):
+        lo, hi = 0, self.n_entries
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._entry_id_at(self._record_offset(mid)) < entry_id:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _find(self, collection_name, key):
+        entry_id = _entry_id(collection_name, key)
+        i = self._lower_bound(entry_id)
+        if i < self.n_entries:
+            offset = self._record_offset(i)
+            if self._entry_id_at(offset) == entry_id:
+                return offset
+        return None
+
+    def _read_record(self, offset):
+        """Returns (key, pickled config, (value offset, value size), value_repr, created)"""
+        value_offset, value_size, id_size, config_size, repr_size, created_size = \
+            _RECORD.unpack_from(self.mmap, offset)
+        start = offset + _RECORD.size
+        entry_id = self.mmap[start:start + id_size].decode()
+        start += id_size
+        config = self.mmap[start:start + config_size]
+        start += config_size
+        value_repr = self.mmap[start:start + repr_size].decode()
+        start += repr_size
+        created = self.mmap[start:start + created_size].decode()
+        return entry_id.split("\0", 1)[1], config, (value_offset, value_size), value_repr, created
+
+    def _load_value(self, location):
+        offset, size = location
+        return serializers.loads(self.mmap[offset:offset + size])
+
+    def _iter_collection(self, collection_name, after_key=None):
+        prefix = _entry_id(collection_name, "")
+        start = _entry_id(collection_name, after_key) if after_key is not None else prefix
+        for i in range(self._lower_bound(start), self.n_entries):
+            offset = self._record_offset(i)
+            entry_id = self._entry_id_at(offset)
+            if not entry_id.startswith(prefix):
+                break
+            if after_key is not None and entry_id == start:
+                continue
+            yield self._read_record(offset)
+
+    def _read_only(self, *args, **kwargs):
+        raise Exception("Snapshot is read-only")
+
+    create_entry = _read_only
+    set_entry_value = _read_only
+    set_entry_values = _read_only
+    set_cached_deps = _read_only
+    clear_cached_deps = _read_only
+    remove_entry_by_key = _read_only
+    remove_entries = _read_only
+    announce_entries = _read_only
+    unannounce_entries = _read_only
+    update_access_times = _read_only
+    evict_entries = _read_only
+    register_executor = _read_only
+    update_heartbeat = _read_only
+    update_stats = _read_only
+    stop_executor = _read_only
+
+    def ensure_collection(self, name, indexes=(), version=None):
+        return 0
+
+    def get_build_times(self):
+        return {}
+
+    def get_entry_by_config(self, collection, config):
+        offset = self._find(collection.name, collection.make_key(config))
+        if offset is None:
+            return None
+        key, _, location, _, created = self._read_record(offset)
+        return Entry(collection, config, self._load_value(location), created)
+
+    def has_entry_by_key(self, collection, key):
+        return self._find(collection.name, key) is not None
+
+    def get_entries(self, collection, keys):
+        result = []
+        for key in keys:
+            offset = self._find(collection.name, key)
+            if offset is None:
+                result.append(None)
+            else:
+                _, _, (value_offset, size), _, created = self._read_record(offset)
+                result.append((self.mmap[value_offset:value_offset + size], created))
+        return result
+
+    def has_entries(self, collection, keys):
+        return [self._find(collection.name, key) is not None for key in keys]
+
+    def get_entry_state(self, collection, key):
+        return "finished" if self.has_entry_by_key(collection, key) else None
+
+    def get_entry_states(self, ref_keys):
+        return ["finished" if self._find(collection_name, key) is not None else None
+                for collection_name, key in ref_keys]
+
+    def get_cached_deps(self, ref_keys):
+        return [None] * len(ref_keys)
+
+    def find_entries(self, collection, filter):
+        conditions = parse_filter(filter)
+        result = []
+        for key, config, location, value_repr, created in self._iter_collection(collection.name):
+            config = pickle.loads(config)
+            if match_config(conditions, config):
+                result.append(Entry(collection, config, self._load_value(location), created))
+        return result
+
+    def export_entries(self, collection_name, after_key=None, limit=1000):
+        result = []
+        for key, config, location, value_repr, created in self._iter_collection(collection_name, after_key):
+            offset, size = location
+            result.append((key, config, self.mmap[offset:offset + size], value_repr, created))
+            if len(result) >= limit:
+                break
+        return result
+
+    def change_counter(self):
+        return 0
+
+    def collection_summaries(self):
+        return [dict(name=name, **info) for name, info in sorted(self.meta["collections"].items())]
+
+    def entry_summaries(self, collection, filter=None):
+        conditions = parse_filter(filter)
+        result = []
+        for key, config, location, value_repr, created in self._iter_collection(collection.name):
+            size = len(config) + location[1]
+            config = pickle.loads(config)
+            if match_config(conditions, config):
+                result.append({"key": key,
+                               "config": config,
+                               "size": size,
+                               "value_repr": value_repr,
+                               "created": created})
+        return result
+
+    def executor_summaries(self):
+        return []
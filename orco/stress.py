@@ -0,0 +1,298 @@
+import argparse
+import collections
+import json
+import multiprocessing
+import queue
+import random
+import time
+import traceback
+
+from .executor import LocalExecutor
+from .runtime import Runtime
+
+
+OPERATIONS = ("announce", "compute", "get", "remove", "rest")
+
+DEFAULT_MIX = {"announce": 1, "compute": 2, "get": 10, "remove": 1, "rest": 2}
+
+
+def parse_mix(text):
+    """Parses a mix of operations, e.g. "compute=2,get=10" -> {"compute": 2, "get": 10}"""
+    mix = {}
+    for item in text.split(","):
+        name, _, weight = item.partition("=")
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise Exception("Unknown operation '{}' (operations: {})".format(name, ", ".join(OPERATIONS)))
+        mix[name] = float(weight) if weight else 1.0
+    return mix
+
+
+def _build_value(config, value_size):
+    return bytes([config % 256]) * value_size
+
+
+def _register_collections(runtime, value_size):
+    base = runtime.register_collection("stress_base", lambda c: _build_value(c, value_size))
+    derived = runtime.register_collection(
+        "stress_derived",
+        lambda c, d: len(d[0].value) + len(d[1].value),
+        lambda c: [base.ref(c), base.ref(c + 1)])
+    return base, derived
+
+
+class _TimedBackend:
+
+    """Proxy of a backend that records the duration of each call of its methods"""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.times = collections.defaultdict(list)
+
+    def __getattr__(self, name):
+        attr = getattr(self.backend, name)
+        if not callable(attr):
+            return attr
+        times = self.times[name]
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return attr(*args, **kwargs)
+            finally:
+                times.append(time.perf_counter() - start)
+        return timed
+
+
+class _StressClient:
+
+    def __init__(self, runtime, value_size, with_rest):
+        self.runtime = runtime
+        self.executor = runtime.executors[0]
+        self.base, self.derived = _register_collections(runtime, value_size)
+        self.rest_client = runtime.serve(testing=True).test_client() if with_rest else None
+
+    def announce(self, config):
+        ref = self.base.ref(config)
+        if self.runtime.db.announce_entries(self.executor.id, [ref]):
+            self.runtime.db.unannounce_entries(self.executor.id, [ref.ref_key()])
+
+    def compute(self, config):
+        self.derived.compute(config)
+
+    def get(self, config):
+        self.derived.get_entry(config)
+        self.base.get_entries([config, config + 1])
+
+    def remove(self, config):
+        self.base.remove(config)
+
+    def rest(self, config):
+        url = ("/collections", "/entries/stress_base", "/executors")[config % 3]
+        response = self.rest_client.get(url)
+        if response.status_code != 200:
+            raise Exception("GET {} returned {}".format(url, response.status_code))
+
+
+def _stress_worker(path, backend, mix, duration, n_configs, value_size, seed, start_event, results):
+    try:
+        rng = random.Random(seed)
+        runtime = Runtime(path, backend=backend)
+        runtime.register_executor(LocalExecutor(heartbeat_interval=1))
+        client = _StressClient(runtime, value_size, "rest" in mix)
+        timed = _TimedBackend(runtime.db)
+        runtime.db = timed
+
+        names = list(mix)
+        weights = [mix[name] for name in names]
+        latencies = {name: [] for name in names}
+        errors = {name: collections.Counter() for name in names}
+        start_event.wait()
+        started = time.time()
+        end = started + duration
+        while time.time() < end:
+            name = rng.choices(names, weights)[0]
+            config = rng.randrange(n_configs)
+            start = time.perf_counter()
+            try:
+                getattr(client, name)(config)
+            except Exception as e:
+                errors[name]["{}: {}".format(type(e).__name__, e)] += 1
+            latencies[name].append(time.perf_counter() - start)
+        elapsed = time.time() - started
+        runtime.db = timed.backend
+        runtime.stop()
+        results.put({"elapsed": elapsed,
+                     "latencies": latencies,
+                     "errors": {name: dict(counter) for name, counter in errors.items()},
+                     "db_times": dict(timed.times)})
+    except BaseException:
+        results.put({"failure": traceback.format_exc()})
+
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def _latency_summary(values):
+    """Returns count and latencies (p50, p90, p99, max) in milliseconds"""
+    values = sorted(values)
+    result = {"count": len(values)}
+    for label, q in (("p50", 0.5), ("p90", 0.9), ("p99", 0.99), ("max", 1.0)):
+        value = _percentile(values, q)
+        result[label] = value * 1000 if value is not None else None
+    return result
+
+
+def run_stress(path, n_processes=4, duration=10.0, mix=None, backend="sqlite",
+               n_configs=1000, value_size=1024, slow_threshold=0.1, mp_context=None):
+    """
+    Runs 'n_processes' processes against one database for 'duration' seconds
+
+    Each process has its own Runtime with a LocalExecutor and repeatedly picks
+    an operation from 'mix' (name -> weight; see OPERATIONS) for a random config:
+    announce (announce + unannounce an entry), compute (an entry with two inputs),
+    get (single and batched lookups), remove, rest (GET of a resource of the REST service).
+
+    Returns a report with throughput and latencies of operations and
+    durations of backend calls. Calls longer than 'slow_threshold' seconds are
+    counted as lock waits (for SQLite they are spent almost entirely waiting for
+    the file lock); "database is locked" failures are counted as lock errors.
+    """
+    mix = dict(mix or DEFAULT_MIX)
+    for name in mix:
+        if name not in OPERATIONS:
+            raise Exception("Unknown operation '{}'".format(name))
+    mp_context = mp_context or multiprocessing.get_context("spawn")
+
+    # Create the schema and collections before the processes race for it
+    runtime = Runtime(path, backend=backend)
+    _register_collections(runtime, value_size)
+    runtime.stop()
+
+    start_event = mp_context.Event()
+    results = mp_context.Queue()
+    processes = [mp_context.Process(target=_stress_worker,
+                                    args=(path, backend, mix, duration, n_configs, value_size,
+                                          i, start_event, results),
+                                    daemon=True)
+                 for i in range(n_processes)]
+    for process in processes:
+        process.start()
+    start_event.set()
+    reports = []
+    try:
+        for _ in processes:
+            reports.append(results.get(timeout=duration + 120))
+    except queue.Empty:
+        raise Exception("Stress processes did not finish in time")
+    finally:
+        for process in processes:
+            process.join(5)
+            if process.is_alive():
+                process.kill()
+    failures = [r["failure"] for r in reports if "failure" in r]
+    if failures:
+        raise Exception("Stress process failed:\n{}".format(failures[0]))
+    elapsed = max(r["elapsed"] for r in reports)
+
+    operations = {}
+    n_operations = 0
+    lock_errors = 0
+    for name in mix:
+        latencies = [value for r in reports for value in r["latencies"][name]]
+        errors = collections.Counter()
+        for r in reports:
+            errors.update(r["errors"][name])
+        summary = _latency_summary(latencies)
+        summary["throughput"] = len(latencies) / elapsed
+        summary["errors"] = dict(errors)
+        operations[name] = summary
+        n_operations += len(latencies)
+        lock_errors += sum(count for message, count in errors.items() if "locked" in message)
+
+    db_calls = {}
+    lock_waits = 0
+    lock_wait_time = 0.0
+    for name in sorted({name for r in reports for name in r["db_times"]}):
+        times = [value for r in reports for value in r["db_times"].get(name, ())]
+        slow = [value for value in times if value > slow_threshold]
+        summary = _latency_summary(times)
+        summary["total"] = sum(times)
+        summary["slow"] = len(slow)
+        db_calls[name] = summary
+        lock_waits += len(slow)
+        lock_wait_time += sum(slow)
+
+    return {"backend": backend,
+            "n_processes": n_processes,
+            "duration": elapsed,
+            "throughput": n_operations / elapsed,
+            "operations": operations,
+            "db_calls": db_calls,
+            "lock_errors": lock_errors,
+            "lock_waits": lock_waits,
+            "lock_wait_time": lock_wait_time}
+
+
+def _format_ms(value):
+    return "{:.1f}".format(value) if value is not None else "-"
+
+
+def format_report(report):
+    lines = ["{} processes, backend {}, {:.1f} s, {:.1f} ops/s".format(
+                report["n_processes"], report["backend"], report["duration"], report["throughput"]),
+             "lock errors: {}, lock waits: {} ({:.2f} s)".format(
+                report["lock_errors"], report["lock_waits"], report["lock_wait_time"]),
+             "",
+             "{:<24}{:>9}{:>10}{:>8}{:>9}{:>9}{:>9}{:>9}".format(
+                "operation", "count", "ops/s", "errors", "p50 ms", "p90 ms", "p99 ms", "max ms")]
+    for name, s in report["operations"].items():
+        lines.append("{:<24}{:>9}{:>10.1f}{:>8}{:>9}{:>9}{:>9}{:>9}".format(
+            name, s["count"], s["throughput"], sum(s["errors"].values()),
+            _format_ms(s["p50"]), _format_ms(s["p90"]), _format_ms(s["p99"]), _format_ms(s["max"])))
+    lines.append("")
+    lines.append("{:<24}{:>9}{:>10}{:>8}{:>9}{:>9}{:>9}{:>9}".format(
+        "db call", "count", "total s", "slow", "p50 ms", "p90 ms", "p99 ms", "max ms"))
+    for name, s in report["db_calls"].items():
+        lines.append("{:<24}{:>9}{:>10.2f}{:>8}{:>9}{:>9}{:>9}{:>9}".format(
+            name, s["count"], s["total"], s["slow"],
+            _format_ms(s["p50"]), _format_ms(s["p90"]), _format_ms(s["p99"]), _format_ms(s["max"])))
+    errors = collections.Counter()
+    for s in report["operations"].values():
+        errors.update(s["errors"])
+    if errors:
+        lines.append("")
+        lines.append("errors:")
+        for message, count in errors.most_common(10):
+            lines.append("  {:>6}x {}".format(count, message))
+    return "\n".join(lines)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser("orco.stress",
+                                     description="Runs concurrent processes against one orco database")
+    parser.add_argument("path", help="database file (it is created when it does not exist)")
+    parser.add_argument("-n", "--processes", type=int, default=4)
+    parser.add_argument("-d", "--duration", type=float, default=10.0, help="seconds")
+    parser.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX,
+                        help="weights of operations, e.g. compute=2,get=10 ({})".format(", ".join(OPERATIONS)))
+    parser.add_argument("--backend", default="sqlite")
+    parser.add_argument("--configs", type=int, default=1000, help="number of distinct configs")
+    parser.add_argument("--value-size", type=int, default=1024, help="bytes")
+    parser.add_argument("--slow", type=float, default=0.1,
+                        help="DB calls longer than this (seconds) are counted as lock waits")
+    parser.add_argument("--json", action="store_true", help="prints the report as JSON")
+    args = parser.parse_args(args)
+    report = run_stress(args.path, args.processes, args.duration, args.mix, args.backend,
+                        args.configs, args.value_size, args.slow)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(format_report(report))
+
+
+if __name__ == "__main__":
+    main()
@@ -8,4 +8,54 @@ class Task:
     def __init__(self, ref: Ref, inputs: Iterable["Task"], is_computed: bool):
         self.ref = ref
         self.inputs = inputs
-        self.is_computed = is_computed
\ No newline at end of file
+        self.is_computed = is_computed
+        # Estimated duration of the task and the longest estimated path
+        # from the task to the end of the computation (filled by Plan)
+        self.duration = 0
+        self.priority = 0
+        # Future of the entry when the task is computed by this session ('future')
+        # or by a concurrent session of the same runtime ('in_flight')
+        self.future = None
+        self.in_flight = None
+        # Run (session) that computes the task and whether its build was started;
+        # a task that was not started may be claimed by a compute called from a build
+        # function of the same run, 'claimed_task' is the claimed task of the outer run
+        self.session = None
+        self.started = False
+        self.claimed = False
+        self.claimed_task = None
+
+    def __repr__(self):
+        return "<Task {}/{}>".format(self.ref.collection.name, self.ref.config)
+
+class Failure:
+
+    """
+    Result of a ref that was not computed in the keep-going mode
+
+    'error' is the exception raised by build_fn (after all retries);
+    when the ref was not computed because one of its inputs failed,
+    'failed_input' is the Failure of that input.
+    """
+
+    __slots__ = ("ref", "error", "traceback", "attempts", "failed_input")
+
+    is_computed = False
+
+    def __init__(self, ref: Ref, error, traceback=None, attempts=0, failed_input=None):
+        self.ref = ref
+        self.error = error
+        self.traceback = traceback
+        self.attempts = attempts
+        self.failed_input = failed_input
+
+    @property
+    def collection(self):
+        return self.ref.collection
+
+    @property
+    def config(self):
+        return self.ref.config
+
+    def __repr__(self):
+        return "<Failure {}/{}: {!r}>".format(self.ref.collection.name, self.ref.config, self.error)
@@ -0,0 +1,93 @@
+from contextlib import contextmanager, nullcontext
+import json
+import os
+import threading
+import time
+
+
+_NO_SPAN = nullcontext()
+
+
+def trace_span(tracer, name, category="orco", **args):
+    """Returns tracer.span(...), or a no-op context manager when tracer is None"""
+    if tracer is None:
+        return _NO_SPAN
+    return tracer.span(name, category, **args)
+
+
+class Tracer:
+
+    """
+    Records spans (name, start, end) per process and thread and exports
+    them as Chrome trace-event JSON (chrome://tracing, Perfetto, speedscope)
+    """
+
+    def __init__(self):
+        self.events = []
+        self.thread_names = {}
+        self.pid = os.getpid()
+        self.lock = threading.Lock()
+
+    def add_span(self, name, start, end, category="orco", args=None, pid=None, tid=None, thread_name=None):
+        """Adds a span; start and end are values of time.time()"""
+        if pid is None:
+            pid = self.pid
+        if tid is None:
+            thread = threading.current_thread()
+            tid = thread.ident
+            thread_name = thread.name
+        event = {"name": name,
+                 "cat": category,
+                 "ph": "X",
+                 "ts": start * 1e6,
+                 "dur": (end - start) * 1e6,
+                 "pid": pid,
+                 "tid": tid}
+        if args:
+            event["args"] = args
+        with self.lock:
+            self.events.append(event)
+            if thread_name is not None:
+                self.thread_names[(pid, tid)] = thread_name
+
+    @contextmanager
+    def span(self, name, category="orco", **args):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.add_span(name, start, time.time(), category, args)
+
+    def to_chrome_trace(self):
+        with self.lock:
+            events = list(self.events)
+            thread_names = dict(self.thread_names)
+        metadata = [{"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}}
+                    for (pid, tid), name in thread_names.items()]
+        metadata.append({"name": "process_name", "ph": "M", "pid": self.pid, "tid": 0,
+                         "args": {"name": "orco"}})
+        return {"traceEvents": metadata + events, "displayTimeUnit": "ms"}
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump(self.to_chrome_trace(), f, default=repr)
+
+
+class TracedBackend:
+
+    """Proxy of a backend that records a span for each call of its methods"""
+
+    def __init__(self, backend, tracer):
+        self.backend = backend
+        self.tracer = tracer
+
+    def __getattr__(self, name):
+        attr = getattr(self.backend, name)
+        if not callable(attr):
+            return attr
+        tracer = self.tracer
+
+        def traced(*args, **kwargs):
+            with tracer.span("db." + name, "db"):
+                return attr(*args, **kwargs)
+        return traced
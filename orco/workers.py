@@ -0,0 +1,147 @@
+from concurrent.futures import Future
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import traceback
+
+logger = logging.getLogger(__name__)
+
+
+class RemoteTraceback(Exception):
+
+    def __init__(self, tb):
+        super().__init__(tb)
+        self.tb = tb
+
+    def __str__(self):
+        return self.tb
+
+
+def memory_usage():
+    """
+    Returns the current resident set size of the current process in bytes
+
+    Returns None when it cannot be read (/proc is not available); the memory
+    limit of workers is not checked then. Peak usage (ru_maxrss) is not used
+    as a fallback, since it never decreases.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+
+def _worker_main(conn):
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            return
+        if job is None:
+            return
+        fn, args = job
+        try:
+            result = (True, fn(*args))
+        except BaseException as e:
+            tb = "".join(traceback.format_exception(type(e), e, e.__traceback__))
+            result = (False, (e, tb))
+        try:
+            conn.send((result, memory_usage()))
+        except Exception as e:
+            # Result or exception is not picklable
+            conn.send(((False, (Exception(repr(e)), "")), memory_usage()))
+
+
+class WorkerPool:
+
+    """
+    Long-lived worker processes; submit() returns a concurrent.futures.Future
+
+    Module state of workers (e.g. results of init_fn of collections) survives
+    between jobs. A worker process is replaced by a new one after 'max_tasks'
+    jobs or when its resident memory exceeds 'max_memory' bytes after a job.
+    Processes are started lazily.
+    """
+
+    def __init__(self, n_workers, max_tasks=None, max_memory=None, mp_context=None):
+        self.max_tasks = max_tasks
+        self.max_memory = max_memory
+        self.mp_context = mp_context or multiprocessing.get_context("spawn")
+        self.n_recycled = 0
+        self.queue = queue.Queue()
+        self.threads = [threading.Thread(target=self._serve, daemon=True) for _ in range(n_workers)]
+        for thread in self.threads:
+            thread.start()
+
+    def submit(self, fn, *args):
+        future = Future()
+        self.queue.put((future, fn, args))
+        return future
+
+    def shutdown(self):
+        for _ in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
+
+    def _start_process(self):
+        parent_conn, child_conn = self.mp_context.Pipe()
+        process = self.mp_context.Process(target=_worker_main, args=(child_conn,), daemon=True)
+        process.start()
+        child_conn.close()
+        return process, parent_conn
+
+    def _stop_process(self, process, conn):
+        try:
+            conn.send(None)
+        except OSError:
+            pass
+        conn.close()
+        process.join(5)
+        if process.is_alive():
+            process.kill()
+            process.join()
+
+    def _serve(self):
+        process = conn = None
+        n_tasks = 0
+        while True:
+            job = self.queue.get()
+            if job is None:
+                break
+            future, fn, args = job
+            if not future.set_running_or_notify_cancel():
+                continue
+            if process is None:
+                process, conn = self._start_process()
+                n_tasks = 0
+            try:
+                conn.send((fn, args))
+                (ok, value), memory = conn.recv()
+            except (EOFError, OSError):
+                future.set_exception(Exception("Worker process {} terminated abruptly".format(process.pid)))
+                self._stop_process(process, conn)
+                process = None
+                continue
+            except Exception as e:
+                # Arguments or the response cannot be (un)pickled
+                future.set_exception(e)
+                continue
+            n_tasks += 1
+            if ok:
+                future.set_result(value)
+            else:
+                error, tb = value
+                error.__cause__ = RemoteTraceback(tb)
+                future.set_exception(error)
+            if (self.max_tasks is not None and n_tasks >= self.max_tasks) or \
+                    (self.max_memory is not None and memory is not None and memory > self.max_memory):
+                logger.debug("Recycling worker %s after %s tasks (memory %s)", process.pid, n_tasks, memory)
+                self._stop_process(process, conn)
+                process = None
+                self.n_recycled += 1
+        if process is not None:
+            self._stop_process(process, conn)
@@ -1,4 +1,5 @@
 
+import importlib.util
 import sys
 import os
 import pytest
@@ -12,11 +13,12 @@ import orco  # noqa
 
 class TestEnv:
 
-    def __init__(self):
+    def __init__(self, backend="sqlite"):
+        self.backend = backend
         self.runtimes = []
 
     def runtime_in_memory(self):
-        r = orco.Runtime(":memory:")
+        r = orco.Runtime(":memory:", backend=self.backend)
         self.runtimes.append(r)
         return r
 
@@ -26,8 +28,19 @@ class TestEnv:
         self.runtimes = []
 
 
-@pytest.fixture()
-def env():
-    test_env = TestEnv()
+# LMDB is an optional dependency; its tests are skipped when it is not installed
+BACKENDS = ["sqlite",
+            pytest.param("lmdb", marks=pytest.mark.skipif(importlib.util.find_spec("lmdb") is None,
+                                                          reason="lmdb is not installed"))]
+
+
+@pytest.fixture(params=BACKENDS)
+def backend(request):
+    return request.param
+
+
+@pytest.fixture
+def env(backend):
+    test_env = TestEnv(backend)
     yield test_env
     test_env.stop()
\ No newline at end of file
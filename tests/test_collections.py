@@ -1,5 +1,6 @@
 
 from orco import Runtime, Obj, LocalExecutor
+from orco.serializers import Serializer, JsonSerializer
 import pytest
 
 def adder(config):
@@ -86,4 +87,307 @@ def test_collection_deps(env):
 
     e = col2.compute(6)
     assert counter == [8, 4]
-    assert e.value == 150
\ No newline at end of file
+    assert e.value == 150
+
+def test_collection_find(env):
+    runtime = env.runtime_in_memory()
+    runtime.register_executor(LocalExecutor())
+
+    def builder(config):
+        return config["size"] * 2
+
+    collection = runtime.register_collection("col1", builder, indexes=["size", "params.algo"])
+    collection.compute_many([{"size": s, "params": {"algo": a}} for s in (10, 500, 1500, 3000) for a in ("x", "y")])
+    collection.insert({"size": 2000}, "inserted")
+
+    def sizes(entries):
+        return sorted((e.config["size"], e.config.get("params", {}).get("algo")) for e in entries)
+
+    assert len(collection.find()) == 9
+    assert sizes(collection.find({"size": {">": 1000}, "params.algo": "x"})) == [(1500, "x"), (3000, "x")]
+    assert sizes(collection.find({"size": {">=": 500, "<": 2000}})) == [(500, "x"), (500, "y"), (1500, "x"), (1500, "y")]
+    assert sizes(collection.find({"size": {"in": [10, 2000]}})) == [(10, "x"), (10, "y"), (2000, None)]
+    assert sizes(collection.find({"params.algo": None})) == [(2000, None)]
+    assert sizes(collection.find({"params.algo": {"!=": "x"}})) == [(10, "y"), (500, "y"), (1500, "y"), (3000, "y")]
+    assert collection.find({"size": 3000, "params.algo": "y"})[0].value == 6000
+    assert collection.find({"size": 7}) == []
+
+    with pytest.raises(Exception):
+        collection.find({"size": {"~": 1}})
+    with pytest.raises(Exception):
+        collection.find({"size') OR 1=1 --": 1})
+    with pytest.raises(Exception):
+        collection.find({"size": [10, 500]})
+    with pytest.raises(Exception):
+        collection.find({"params": {"==": {"algo": "x"}}})
+    with pytest.raises(Exception):
+        collection.find({"size": {"in": [10, [500]]}})
+
+
+def test_collection_find_index(env):
+    runtime = env.runtime_in_memory()
+    values = [-2.5, -1, 0, -0.0, 1, 1.0, 2, 2 ** 60, 2 ** 60 + 1, True, "", "a", "a\0b", "ab", "b", None, [1], {"y": 1}]
+    indexed = runtime.register_collection("indexed", indexes=["x"])
+    plain = runtime.register_collection("plain")
+    for c in (indexed, plain):
+        for i, value in enumerate(values):
+            c.insert({"i": i, "x": value} if value is not None else {"i": i}, i)
+        c.remove({"i": 4, "x": 1})
+
+    scalars = [v for v in values if not isinstance(v, (list, dict))]
+    filters = [{"x": v} for v in scalars]
+    filters += [{"x": {op: v}} for op in ("<", "<=", ">", ">=", "!=") for v in scalars if v is not None]
+    filters += [{"x": {"in": [1, "a", 2 ** 60]}}, {"x": {">": 0, "<": "b"}}, {"i": 2, "x": {">": -5}}]
+
+    def check():
+        for f in filters:
+            assert sorted(e.value for e in indexed.find(f)) == sorted(e.value for e in plain.find(f)), f
+            assert len(runtime.entry_summaries("indexed", f)) == len(runtime.entry_summaries("plain", f))
+
+    check()
+    assert sorted(e.value for e in indexed.find({"x": {"<": 1}})) == [0, 1, 2, 3]
+    # An index declared later covers existing entries
+    runtime.db.ensure_collection("plain", ["x"])
+    check()
+
+
+def test_collection_find_non_json_config(env, tmp_path):
+    runtime = env.runtime_in_memory()
+    runtime.register_executor(LocalExecutor())
+    collection = runtime.register_collection("col1", lambda c: c["a"], indexes=["a"])
+    collection.insert({"a": 1, "_extra": object()}, 5)
+    collection.compute({"a": 2, "_extra": {1, 2}})
+    collection.insert({"a": float("nan")}, 6)
+    collection.insert({"a": 3}, 7)
+
+    assert len(collection.find()) == 4
+    assert sorted(e.value for e in collection.find({"a": {">=": 1}})) == [2, 5, 7]
+    assert collection.find({"a": None}) == []
+    assert len(runtime.entry_summaries("col1", {"a": 1})) == 1
+
+    path = str(tmp_path / "snapshot")
+    runtime.freeze(path)
+    snapshot = Runtime(path, backend="snapshot")
+    try:
+        s = snapshot.register_collection("col1")
+        assert sorted(e.value for e in s.find({"a": {">=": 1}})) == [2, 5, 7]
+        assert s.find({"a": None}) == []
+    finally:
+        snapshot.stop()
+
+
+def test_collection_cache_deps(env):
+    runtime = env.runtime_in_memory()
+    runtime.register_executor(LocalExecutor())
+    dep_calls = [0, 0]
+
+    def make_deps1(config):
+        dep_calls[0] += 1
+        return [col1.ref(x) for x in range(config)]
+
+    def make_deps2(config):
+        dep_calls[1] += 1
+        return [col2.ref(config), col2.ref(config - 1)]
+
+    col1 = runtime.register_collection("col1", lambda c: c * 10)
+    col2 = runtime.register_collection("col2", lambda c, d: sum(e.value for e in d), make_deps1, cache_deps=True)
+    col3 = runtime.register_collection("col3", lambda c, d: d[0].value - d[1].value, make_deps2)
+
+    assert col3.compute(5).value == 40
+    assert dep_calls == [2, 1]
+
+    col2.remove_many([4, 5])
+    col3.remove(5)
+    assert col3.compute(5).value == 40
+    assert dep_calls == [2, 2]
+
+    col2.clear_deps_cache()
+    col2.remove(5)
+    col3.remove(5)
+    assert col3.compute(5).value == 40
+    assert dep_calls == [3, 3]
+
+
+def test_collection_build_fn_many(env):
+    runtime = env.runtime_in_memory()
+    runtime.register_executor(LocalExecutor())
+    batches = []
+
+    def build_many1(configs, inputs):
+        assert inputs is None
+        batches.append(("col1", list(configs)))
+        return [c * 10 for c in configs]
+
+    def build_many2(configs, inputs):
+        batches.append(("col2", list(configs)))
+        return [sum(e.value for e in entries) for entries in inputs]
+
+    col1 = runtime.register_collection("col1", build_fn_many=build_many1, batch_size=4)
+    col2 = runtime.register_collection("col2", build_fn_many=build_many2,
+                                       dep_fn=lambda c: [col1.ref(x) for x in range(c)])
+
+    assert [e.value for e in col1.compute_many(list(range(10)))] == list(range(0, 100, 10))
+    assert sorted(len(b) for _, b in batches) == [2, 4, 4]
+
+    del batches[:]
+    assert [e.value for e in col2.compute_many([3, 5, 12])] == [30, 100, 660]
+    assert [len(b) for n, b in batches if n == "col1"] == [2]
+    assert [sorted(b) for n, b in batches if n == "col2"] == [[3, 5, 12]]
+
+
+def test_collection_build_fn_many_invalid(env):
+    runtime = env.runtime_in_memory()
+    runtime.register_executor(LocalExecutor())
+    col = runtime.register_collection("col1", build_fn_many=lambda configs, inputs: [1])
+    with pytest.raises(Exception):
+        col.compute_many([1, 2])
+    assert col.get_entry_by_status(1) is None
+
+
+def test_collection_version(tmp_path, backend):
+    path = str(tmp_path / "db")
+
+    def register(version1, version2):
+        runtime = Runtime(path, backend=backend)
+        runtime.register_executor(LocalExecutor())
+        col1 = runtime.register_collection("col1", lambda c: c * version1, version=version1)
+        col2 = runtime.register_collection("col2", lambda c, d: d[0].value + 1,
+                                           lambda c: [col1.ref(c)], version=version2)
+        col3 = runtime.register_collection("col3", lambda c, d: d[0].value + 2,
+                                           lambda c: [col2.ref(c)])
+        other = runtime.register_collection("other", lambda c: c, version=1)
+        return runtime, col1, col2, col3, other
+
+    runtime, col1, col2, col3, other = register(10, 1)
+    col3.compute_many([1, 2])
+    other.compute_many([1, 2])
+    col2.compute(3)
+    runtime.stop()
+
+    runtime, col1, col2, col3, other = register(10, 1)
+    assert all(col3.has_entry(c) for c in (1, 2))
+    runtime.stop()
+
+    runtime, col1, col2, col3, other = register(10, 2)
+    assert all(col1.has_entry(c) for c in (1, 2))
+    assert not any(col2.has_entry(c) for c in (1, 2, 3))
+    assert not any(col3.has_entry(c) for c in (1, 2))
+    assert all(other.has_entry(c) for c in (1, 2))
+    runtime.stop()
+
+    runtime, col1, col2, col3, other = register(100, 2)
+    assert not any(col1.has_entry(c) for c in (1, 2))
+    assert col3.compute(1).value == 103
+    assert all(other.has_entry(c) for c in (1, 2))
+    runtime.stop()
+
+
+def test_collection_version_removed_input(tmp_path, backend):
+    path = str(tmp_path / "db")
+
+    def register(version):
+        runtime = Runtime(path, backend=backend)
+        runtime.register_executor(LocalExecutor())
+        a = runtime.register_collection("a", lambda c: c * version, version=version, max_entries=0)
+        b = runtime.register_collection("b", lambda c, d: d[0].value + 1, lambda c: [a.ref(c)])
+        return runtime, a, b
+
+    runtime, a, b = register(1)
+    assert b.compute_many([5, 6, 7])[0].value == 6
+    a.remove(6)
+    assert runtime.evict() == 2
+    assert b.get_entry(5).value == 6
+    runtime.stop()
+
+    runtime, a, b = register(100)
+    assert not any(b.has_entry(c) for c in (5, 6, 7))
+    assert b.compute(5).value == 501
+    runtime.stop()
+
+
+def test_collection_get_entries(env):
+    runtime = env.runtime_in_memory()
+    runtime.register_executor(LocalExecutor())
+    c = runtime.register_collection("col1", lambda c: c * 10)
+    other = runtime.register_collection("col2")
+    c.compute_many(list(range(0, 1000, 2)))
+    other.insert(1, "x")
+    runtime.db.announce_entries(runtime.executors[0].id, [c.ref(1001)])
+
+    configs = list(range(999, -3, -1)) + [1001]
+    entries = c.get_entries(configs)
+    assert len(entries) == len(configs)
+    for config, entry in zip(configs, entries):
+        if config % 2 == 0 and config >= 0 and config < 1000:
+            assert entry.config == config
+            assert entry.value == config * 10
+        else:
+            assert entry is None
+    assert c.get_entries([]) == []
+
+    assert c.has_entries([1, 2, 1001, 4, -1]) == [False, True, False, True, False]
+    assert other.has_entries([1, 2]) == [True, False]
+
+
+def test_collection_serializer(tmp_path, backend):
+    path = str(tmp_path / "db")
+
+    runtime = Runtime(path, backend=backend)
+    runtime.register_executor(LocalExecutor())
+    col1 = runtime.register_collection("col1", lambda c: {"x": [c, "a"]}, serializer="json")
+    col1.compute_many([1, 2])
+    col1.insert(3, (1, 2))
+    runtime.stop()
+
+    runtime = Runtime(path, backend=backend)
+    col1 = runtime.register_collection("col1", serializer="marshal")
+    col1.insert(4, (1, b"x", 2.5))
+    assert col1.get_entry(1).value == {"x": [1, "a"]}
+    assert col1.get_entry(3).value == [1, 2]
+    assert col1.get_entry(4).value == (1, b"x", 2.5)
+    assert [e.value for e in col1.get_entries([2, 4])] == [{"x": [2, "a"]}, (1, b"x", 2.5)]
+    assert sorted(str(e.value) for e in col1.find()) == sorted(str(e.value) for e in col1.get_entries([1, 2, 3, 4]))
+
+    with pytest.raises(Exception):
+        runtime.register_collection("col2", serializer="xxx")
+    runtime.stop()
+
+
+def test_collection_serializer_array(env):
+    np = pytest.importorskip("numpy")
+    runtime = env.runtime_in_memory()
+    runtime.register_executor(LocalExecutor())
+    col1 = runtime.register_collection("col1", lambda c: np.arange(c * 6, dtype=np.float32).reshape(c, 6),
+                                       serializer="array")
+    col1.compute_many([1, 3])
+    value = col1.get_entry(3).value
+    assert value.dtype == np.float32
+    assert value.shape == (3, 6)
+    assert (value == np.arange(18).reshape(3, 6)).all()
+    assert (col1.get_entries([1])[0].value == np.arange(6)).all()
+
+
+class UpperSerializer(Serializer):
+
+    name = "test-upper"
+
+    def dumps(self, value):
+        return value.upper().encode()
+
+    def loads(self, data):
+        return bytes(data).decode().lower()
+
+
+def test_collection_custom_serializer(env):
+    runtime = env.runtime_in_memory()
+    runtime.register_executor(LocalExecutor())
+    col1 = runtime.register_collection("col1", lambda c: "value{}".format(c), serializer=UpperSerializer())
+    col1.compute(1)
+    col1.insert(2, "abc")
+    assert col1.get_entry(1).value == "value1"
+    assert [e.value for e in col1.get_entries([1, 2])] == ["value1", "abc"]
+
+    other = JsonSerializer()
+    other.name = "test-upper"
+    with pytest.raises(Exception, match="already used"):
+        runtime.register_collection("col2", serializer=other)
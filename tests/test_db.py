@@ -1,4 +1,4 @@
-from orco import LocalExecutor
+from orco import Runtime, LocalExecutor
 from orco.entry import Entry
 import time
 from datetime import datetime
@@ -54,4 +54,126 @@ def test_db_set_value(env):
         r.db.create_entry(entry2)
 
     entry3 = Entry(c, "cfg3", "value3", datetime.now())
-    r.db.create_entry(entry3)
\ No newline at end of file
+    r.db.create_entry(entry3)
+
+def test_db_reopen(tmp_path, backend):
+    path = str(tmp_path / "db")
+    r = Runtime(path, backend=backend)
+    c = r.register_collection("col1")
+    c.insert({"x": 1}, "value1")
+    r.stop()
+
+    r = Runtime(path, backend=backend)
+    c = r.register_collection("col1")
+    assert c.get_entry({"x": 1}).value == "value1"
+    assert c.get_entry({"x": 2}) is None
+    assert r.collection_summaries()[0]["count"] == 1
+    r.stop()
+
+
+def test_db_unknown_backend():
+    with pytest.raises(Exception):
+        Runtime(":memory:", backend="xyz")
+
+
+def test_db_dedup_values(env):
+    r = env.runtime_in_memory()
+    c = r.register_collection("col1")
+    value = "x" * 10000
+    for i in range(5):
+        c.insert(i, value)
+    c.insert(5, "y" * 10000)
+
+    summary = r.collection_summaries()[0]
+    assert summary["size"] > 60000
+    assert summary["physical_size"] < 25000
+    assert c.get_entry(3).value == value
+
+    c.remove_many([0, 1, 2, 3, 5])
+    assert c.get_entry(4).value == value
+    assert r.collection_summaries()[0]["physical_size"] < 15000
+    c.remove(4)
+    assert r.collection_summaries()[0]["physical_size"] == 0
+
+
+def test_db_duplicate_insert(env):
+    r = env.runtime_in_memory()
+    c = r.register_collection("col1", max_entries=1)
+    c.insert(1, "b" * 10000)
+    with pytest.raises(Exception):
+        c.insert(1, "d")
+    assert r.evict() == 0
+    c.remove(1)
+    if env.backend == "sqlite":
+        assert r.db.executor.submit(lambda: r.db.conn.execute("SELECT COUNT(*) FROM blobs").fetchone()).result() == (0,)
+
+
+def _create_unversioned_db(path):
+    # Schema of databases created before schema versions were introduced
+    import pickle
+    import sqlite3
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE collections (name TEXT NOT NULL PRIMARY KEY);
+        CREATE TABLE executors (
+            id INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT, created TEXT NOT NULL, heartbeat TEXT NOT NULL,
+            heartbeat_interval FLOAT NOT NULL, stats TEXT, type STRING NOT NULL,
+            version STRING NOT NULL, resources STRING NOT NULL);
+        CREATE TABLE entries (
+            collection STRING NOT NULL, key TEXT NOT NULL, config BLOB NOT NULL,
+            value BLOB, value_repr STRING, created TEXT, executor INTEGER,
+            PRIMARY KEY (collection, key)
+            CONSTRAINT collection_ref FOREIGN KEY (collection) REFERENCES collections(name) ON DELETE CASCADE
+            CONSTRAINT executor_ref FOREIGN KEY (executor) REFERENCES executors(uuid) ON DELETE CASCADE);
+        CREATE TABLE deps (
+            collection_s STRING NOT NULL, key_s STRING NOT NULL, collection_t STRING NOT NULL, key_t STRING NOT NULL,
+            UNIQUE(collection_s, key_s, collection_t, key_t),
+            CONSTRAINT entry_s_ref FOREIGN KEY (collection_s, key_s)
+                REFERENCES entries(collection, key) ON DELETE CASCADE,
+            CONSTRAINT entry_t_ref FOREIGN KEY (collection_t, key_t)
+                REFERENCES entries(collection, key) ON DELETE CASCADE);
+        INSERT INTO collections VALUES ('col1'), ('col2');
+    """)
+    entries = [("col1", 1, 10), ("col1", 2, 20), ("col2", 1, 30)]
+    conn.executemany("INSERT INTO entries VALUES (?, ?, ?, ?, ?, ?, null)",
+                     [(name, repr(config), pickle.dumps(config), pickle.dumps(value), repr(value), str(datetime.now()))
+                      for name, config, value in entries])
+    conn.executemany("INSERT INTO deps VALUES (?, ?, ?, ?)", [("col1", "1", "col2", "1"), ("col1", "2", "col2", "1")])
+    conn.commit()
+    conn.close()
+
+
+def test_db_migrate_unversioned(tmp_path):
+    path = str(tmp_path / "db")
+    _create_unversioned_db(path)
+
+    def register(runtime, version=None):
+        col1 = runtime.register_collection("col1", lambda c: c * 10, version=version)
+        col2 = runtime.register_collection("col2", lambda c, d: sum(e.value for e in d),
+                                           lambda c: [col1.ref(c), col1.ref(c + 1)])
+        return col1, col2
+
+    def query(runtime, sql):
+        return runtime.db.executor.submit(lambda: runtime.db.conn.execute(sql).fetchall()).result()
+
+    r = Runtime(path)
+    r.register_executor(LocalExecutor())
+    col1, col2 = register(r)
+    assert query(r, "PRAGMA user_version") == [(r.db.SCHEMA_VERSION,)]
+    assert query(r, "PRAGMA auto_vacuum") == [(2,)]
+    assert sorted(query(r, "SELECT collection, key, config_json FROM entries")) == \
+        [("col1", "1", "1"), ("col1", "2", "2"), ("col2", "1", "1")]
+    assert sorted(query(r, "SELECT key_s, key_t FROM deps")) == [("1", "1"), ("2", "1")]
+    assert col2.get_entry(1).value == 30
+    assert col1.get_entries([1, 2, 3])[1].value == 20
+    assert col2.compute(5).value == 110
+    assert col2.compute(2).value == 50
+    # Migrated values are deduplicated with new ones (30 and 50 are stored once)
+    assert query(r, "SELECT COUNT(*), SUM(refcount) FROM blobs") == [(6, 8)]
+    r.stop()
+
+    # Reopening does not migrate again; a new version of col1 removes col2 entries through migrated deps
+    r = Runtime(path)
+    col1, col2 = register(r, version=2)
+    assert query(r, "SELECT collection, key FROM entries") == []
+    r.stop()
@@ -0,0 +1,76 @@
+from orco import LocalExecutor
+from orco.entry import Entry
+from datetime import datetime
+import time
+
+
+def test_evict_max_entries(env):
+    runtime = env.runtime_in_memory()
+    runtime.register_executor(LocalExecutor())
+    c = runtime.register_collection("col1", lambda c: c * 10, max_entries=3)
+    other = runtime.register_collection("col2", lambda c: c * 10)
+
+    c.compute_many(list(range(5)))
+    other.compute_many(list(range(5)))
+    time.sleep(0.01)
+    assert c.get_entry(0).value == 0
+
+    assert runtime.evict() == 2
+    assert [c.has_entry(i) for i in range(5)] == [True, False, False, True, True]
+    assert all(other.has_entry(i) for i in range(5))
+    assert runtime.evict() == 0
+
+
+def test_evict_max_bytes(env):
+    runtime = env.runtime_in_memory()
+    c = runtime.register_collection("col1", max_bytes=25000)
+    for i in range(5):
+        c.insert(i, "x" * 10000)
+    assert runtime.evict() == 3
+    assert [c.has_entry(i) for i in range(5)] == [False, False, False, True, True]
+    assert runtime.collection_summaries()[0]["size"] <= 25000
+
+
+def test_evict_ttl(env):
+    runtime = env.runtime_in_memory()
+    c = runtime.register_collection("col1", ttl=0.5)
+    c.insert(1, "a")
+    c.insert(2, "b")
+    time.sleep(0.3)
+    c.get_entry(1)
+    time.sleep(0.3)
+    assert runtime.evict() == 1
+    assert c.has_entry(1)
+    assert not c.has_entry(2)
+
+
+def test_evict_keeps_inputs_of_unfinished(env):
+    runtime = env.runtime_in_memory()
+    executor = LocalExecutor()
+    runtime.register_executor(executor)
+    c1 = runtime.register_collection("col1", max_entries=0)
+    c2 = runtime.register_collection("col2")
+    c1.insert(1, "a")
+    c1.insert(2, "b")
+    assert runtime.db.announce_entries(executor.id, [c2.ref("x")], [(c1.ref(1), c2.ref("x"))])
+
+    assert runtime.evict() == 1
+    assert c1.has_entry(1)
+    assert not c1.has_entry(2)
+
+    runtime.db.set_entry_value(executor.id, Entry(c2, "x", "value", datetime.now()))
+    assert runtime.evict() == 1
+    assert not c1.has_entry(1)
+    assert c2.has_entry("x")
+
+
+def test_evictor_thread(env):
+    runtime = env.runtime_in_memory()
+    c = runtime.register_collection("col1", max_entries=1)
+    c.insert(1, "a")
+    c.insert(2, "b")
+    runtime.start_evictor(interval=0.1)
+    time.sleep(0.5)
+    runtime.stop_evictor()
+    assert not c.has_entry(1)
+    assert c.has_entry(2)
@@ -1,8 +1,12 @@
 
 
-from orco import Runtime, LocalExecutor
+from orco import Runtime, LocalExecutor, Failure
+import os
+import threading
 import time
 
+import pytest
+
 
 def test_executor(env):
     def to_dict(lst):
@@ -40,3 +44,264 @@ def test_executor(env):
     assert r[executor.id]["status"] == "running"
     assert r[executor2.id]["status"] == "lost"
     assert r[executor3.id]["status"] == "stopped"
+
+
+def test_executor_keep_going(env):
+    runtime = env.runtime_in_memory()
+    executor = LocalExecutor(n_workers=2)
+    runtime.register_executor(executor)
+
+    def build1(config):
+        if config == 3:
+            raise Exception("Invalid config")
+        return config
+
+    def build2(config, inputs):
+        return sum(e.value for e in inputs)
+
+    col1 = runtime.register_collection("col1", build1)
+    col2 = runtime.register_collection("col2", build2, lambda c: [col1.ref(x) for x in c])
+
+    with pytest.raises(Exception):
+        col2.compute_many([[1, 2], [2, 3]])
+
+    r = col2.compute_many([[1, 2], [2, 3], [4]], keep_going=True)
+    assert r[0].value == 3
+    assert isinstance(r[1], Failure)
+    assert str(r[1].failed_input.error) == "Invalid config"
+    assert r[1].failed_input.ref.config == 3
+    assert r[1].failed_input.attempts == 1
+    assert "Invalid config" in r[1].failed_input.traceback
+    assert r[2].value == 4
+    assert executor.stats["n_failed"] == 2
+
+    assert col1.get_entry_by_status(3) is None
+    assert col2.get_entry_by_status([2, 3]) is None
+    assert col1.get_entry_by_status(2) == "finished"
+    assert col2.get_entry_by_status([1, 2]) == "finished"
+
+    r = col1.compute_many([3, 5], keep_going=True)
+    assert isinstance(r[0], Failure)
+    assert r[0].failed_input is None
+    assert r[1].value == 5
+
+
+def test_executor_retries(env):
+    runtime = env.runtime_in_memory()
+    runtime.register_executor(LocalExecutor(n_retries=2, retry_delay=0.1, retry_backoff=2))
+    calls = []
+
+    def build(config):
+        calls.append(time.time())
+        if len(calls) < config:
+            raise Exception("Try again")
+        return config
+
+    col = runtime.register_collection("col", build)
+    assert col.compute(3).value == 3
+    assert len(calls) == 3
+    assert calls[1] - calls[0] >= 0.1
+    assert calls[2] - calls[1] >= 0.2
+
+    del calls[:]
+    r = col.compute(4, keep_going=True)
+    assert isinstance(r, Failure)
+    assert r.attempts == 3
+    assert len(calls) == 3
+
+
+def _shm_segments():
+    return set(name for name in os.listdir("/dev/shm") if name.startswith("psm_"))
+
+
+def test_executor_processes(env):
+    runtime = env.runtime_in_memory()
+    runtime.register_executor(LocalExecutor(n_workers=2, processes=True))
+
+    def build1(config):
+        return os.getpid()
+
+    def build2(config, inputs):
+        if config == "fail":
+            raise Exception("Failed in worker")
+        return [e.value for e in inputs] + [os.getpid()]
+
+    col1 = runtime.register_collection("col1", build1)
+    col2 = runtime.register_collection("col2", build2, lambda c: [col1.ref(1), col1.ref(2)])
+
+    r = col2.compute("x").value
+    assert len(r) == 3
+    assert os.getpid() not in r
+
+    r = col2.compute("fail", keep_going=True)
+    assert isinstance(r, Failure)
+    assert "Failed in worker" in r.traceback
+
+    col3 = runtime.register_collection("col3", build_fn_many=lambda configs, inputs: [(c, len(configs)) for c in configs])
+    assert [e.value for e in col3.compute_many([1, 2, 3])] == [(1, 3), (2, 3), (3, 3)]
+
+
+def test_executor_processes_shared_memory(env):
+    np = pytest.importorskip("numpy")
+    runtime = env.runtime_in_memory()
+    runtime.register_executor(LocalExecutor(n_workers=2, processes=True))
+
+    def build1(config):
+        return np.full(1024 * 1024, config, dtype=np.int64)
+
+    def build2(config, inputs):
+        for e in inputs:
+            # Views into shared memory, not copies
+            assert not e.value.flags.owndata
+            assert not e.value.flags.writeable
+        return int(sum(e.value.sum() for e in inputs))
+
+    col1 = runtime.register_collection("col1", build1)
+    col2 = runtime.register_collection("col2", build2, lambda c: [col1.ref(i) for i in range(c)])
+
+    before = _shm_segments()
+    results = col2.compute_many([2, 3, 4])
+    assert [e.value for e in results] == [1024 * 1024 * x for x in (1, 3, 6)]
+    assert col2.compute(5).value == 1024 * 1024 * 10
+    assert _shm_segments() == before
+
+
+def test_executor_init_fn_threads(env):
+    runtime = env.runtime_in_memory()
+    runtime.register_executor(LocalExecutor(n_workers=2))
+    calls = []
+
+    def init():
+        calls.append(1)
+        return {"model": 100}
+
+    col1 = runtime.register_collection("col1", lambda c, state: c + state["model"], init_fn=init)
+    col2 = runtime.register_collection("col2", lambda c, inputs, state: inputs[0].value + state["model"],
+                                       lambda c: [col1.ref(c)], init_fn=init)
+    assert [e.value for e in col1.compute_many(range(5))] == [100, 101, 102, 103, 104]
+    assert col2.compute(10).value == 210
+    assert len(calls) == 1
+
+
+def test_executor_init_fn_processes(env):
+    runtime = env.runtime_in_memory()
+    runtime.register_executor(LocalExecutor(n_workers=1, processes=True, max_tasks_per_worker=3))
+
+    def init():
+        return {"pid": os.getpid(), "counter": [0]}
+
+    def build(config, state):
+        state["counter"][0] += 1
+        return state["pid"], state["counter"][0], os.getpid()
+
+    col1 = runtime.register_collection("col1", build, init_fn=init)
+    results = [col1.compute(i).value for i in range(4)]
+    results += [e.value for e in col1.compute_many(range(4, 6))]
+    assert all(init_pid == pid for init_pid, _, pid in results)
+    assert [counter for _, counter, _ in results] == [1, 2, 3, 1, 2, 3]
+    pids = [pid for _, _, pid in results]
+    assert pids[0] == pids[1] == pids[2] != pids[3] == pids[4] == pids[5]
+
+    col2 = runtime.register_collection("col2", build_fn_many=lambda configs, inputs, state: [state] * len(configs),
+                                       init_fn=lambda: "state")
+    assert [e.value for e in col2.compute_many([1, 2])] == ["state", "state"]
+
+
+def test_executor_worker_memory_limit(env):
+    runtime = env.runtime_in_memory()
+    runtime.register_executor(LocalExecutor(n_workers=1, processes=True, max_worker_memory=1))
+    col1 = runtime.register_collection("col1", lambda c: os.getpid())
+    pids = [col1.compute(i).value for i in range(3)]
+    assert len(set(pids)) == 3
+
+
+def test_executor_concurrent_sessions(env):
+    runtime = env.runtime_in_memory()
+    executor = LocalExecutor(n_workers=2)
+    runtime.register_executor(executor)
+    calls = []
+    lock = threading.Lock()
+
+    def build1(config):
+        with lock:
+            calls.append(config)
+        time.sleep(0.05)
+        return config * 10
+
+    def build2(config, inputs):
+        return sum(e.value for e in inputs)
+
+    col1 = runtime.register_collection("col1", build1)
+    col2 = runtime.register_collection("col2", build2, lambda c: [col1.ref(i) for i in range(c)])
+
+    results = {}
+    errors = []
+
+    def session(name, configs):
+        try:
+            results[name] = [e.value for e in col2.compute_many(configs)]
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=session, args=(i, [6, 8 + i])) for i in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not errors
+    assert results == {i: [150, sum(range(8 + i)) * 10] for i in range(4)}
+    assert sorted(calls) == list(range(11))
+    assert executor.n_sessions == 0
+
+
+def test_executor_concurrent_sessions_failure(env):
+    runtime = env.runtime_in_memory()
+    runtime.register_executor(LocalExecutor(n_workers=2))
+    started = threading.Event()
+
+    def build1(config):
+        started.set()
+        time.sleep(0.2)
+        raise Exception("Failed")
+
+    col1 = runtime.register_collection("col1", build1)
+    col2 = runtime.register_collection("col2", lambda c, d: 1, lambda c: [col1.ref(0)])
+
+    errors = []
+
+    def first():
+        try:
+            col1.compute(0)
+        except Exception as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=first)
+    thread.start()
+    started.wait()
+    result = col2.compute(1, keep_going=True)
+    thread.join()
+    assert isinstance(result, Failure)
+    assert "Failed" in str(result.error)
+    assert len(errors) == 1
+    assert col1.get_entry_by_status(0) is None
+
+
+def test_executor_nested_compute(env):
+    runtime = env.runtime_in_memory()
+    runtime.register_executor(LocalExecutor())
+    col1 = runtime.register_collection("col1", lambda c: c * 2)
+    col2 = runtime.register_collection("col2", lambda c: col1.compute(c).value + 1)
+    col3 = runtime.register_collection("col3", lambda c: col2.compute(c).value + col1.compute(c + 1).value)
+    assert col2.compute(3).value == 7
+    assert col3.compute(4).value == 19
+    assert col1.get_entry(5).value == 10
+
+    # col1/7 is queued by the calling run, so it is built by the nested compute
+    results = runtime.compute_refs([col2.ref(7), col1.ref(7)])
+    assert [e.value for e in results] == [15, 14]
+    assert runtime.executors[0].n_sessions == 0
+
+    col4 = runtime.register_collection("col4", lambda c: col4.compute(c).value)
+    with pytest.raises(Exception, match="cannot wait"):
+        col4.compute(1)
+    assert not col4.has_entry(1)
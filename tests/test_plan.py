@@ -0,0 +1,93 @@
+from orco import LocalExecutor
+import threading
+import time
+
+
+def make_collections(runtime, order=None):
+    def build_slow(config):
+        if order is not None:
+            order.append(("slow", config))
+        time.sleep(0.2)
+        return config
+
+    def build_fast(config):
+        if order is not None:
+            order.append(("fast", config))
+        return config
+
+    def build_sum(config, inputs):
+        return sum(e.value for e in inputs)
+
+    slow = runtime.register_collection("slow", build_slow)
+    fast = runtime.register_collection("fast", build_fast)
+    total = runtime.register_collection(
+        "sum", build_sum, lambda c: [fast.ref(i) for i in range(c)] + [slow.ref(c)])
+    return slow, fast, total
+
+
+def test_plan_does_not_announce(env):
+    runtime = env.runtime_in_memory()
+    runtime.register_executor(LocalExecutor())
+    slow, fast, total = make_collections(runtime)
+    fast.compute(0)
+
+    plan = runtime.plan([total.ref(3)])
+    assert plan.n_tasks == 5
+    assert plan.n_to_compute == 4
+    assert plan.collections == {
+        "sum": {"computed": 0, "to_compute": 1, "build_time": None},
+        "fast": {"computed": 1, "to_compute": 2, "build_time": plan.collections["fast"]["build_time"]},
+        "slow": {"computed": 0, "to_compute": 1, "build_time": None},
+    }
+    assert plan.collections["fast"]["build_time"] < 0.1
+    assert total.get_entry_by_status(3) is None
+    assert slow.get_entry_by_status(3) is None
+    assert [t.ref.config for t in plan.requested_tasks] == [3]
+
+
+def test_plan_estimates(env):
+    runtime = env.runtime_in_memory()
+    runtime.register_executor(LocalExecutor())
+    slow, fast, total = make_collections(runtime)
+    total.compute(1)
+
+    plan = runtime.plan([total.ref(2), total.ref(3)])
+    assert plan.collections["slow"]["build_time"] >= 0.2
+    assert plan.total_time >= 0.4
+    assert 0.2 <= plan.critical_path_time < 0.4
+    assert [t.ref.collection.name for t in plan.critical_path] == ["slow", "sum"]
+
+    plan = runtime.plan([total.ref(1)])
+    assert plan.n_to_compute == 0
+    assert plan.critical_path == []
+    assert plan.total_time == 0
+
+
+def test_executor_runs_critical_path_first(env):
+    runtime = env.runtime_in_memory()
+    runtime.register_executor(LocalExecutor())
+    order = []
+    slow, fast, total = make_collections(runtime, order)
+    slow.compute(100)
+    fast.compute(100)
+
+    del order[:]
+    assert total.compute(3).value == 6
+    assert order[0] == ("slow", 3)
+
+
+def test_executor_parallel(env):
+    runtime = env.runtime_in_memory()
+    runtime.register_executor(LocalExecutor(n_workers=4))
+    threads = set()
+
+    def build(config):
+        threads.add(threading.get_ident())
+        time.sleep(0.2)
+        return config * 2
+
+    col = runtime.register_collection("col", build)
+    start = time.time()
+    assert [e.value for e in col.compute_many(list(range(8)))] == list(range(0, 16, 2))
+    assert time.time() - start < 1.0
+    assert len(threads) == 4
@@ -1,4 +1,7 @@
 from orco import Runtime, LocalExecutor
+import gzip
+import json
+import pickle
 from multiprocessing import Process
 from contextlib import contextmanager
 
@@ -26,7 +29,7 @@ def test_rest_collections():
         rr = r.get_json()
         assert len(rr) == 2
 
-        assert rr[1] == {"name": "hello2", "count": 0, "size": 0}
+        assert rr[1] == {"name": "hello2", "count": 0, "size": 0, "physical_size": 0}
         assert rr[0]["name"] == "hello"
         assert rr[0]["count"] == 2
         assert (1024 * 1024) < rr[0]["size"] < (1024 * 1024 + 2000)
@@ -43,6 +46,17 @@ def test_rest_collections():
         assert rr[0]["config"] == "e2"
         assert rr[1]["config"] == {'x': 1, 'y': [1, 2, 3]}
 
+        r = client.get("entries/hello", query_string={"filter": '{"x": {">=": 1}}'})
+        rr = r.get_json()
+        assert len(rr) == 1
+        assert rr[0]["config"] == {'x': 1, 'y': [1, 2, 3]}
+
+        r = client.get("entries/hello", query_string={"filter": '{"x": {"?": 1}}'})
+        assert r.status_code == 400
+
+        r = client.get("entries/hello", query_string={"filter": '{"y": [1, 2, 3]}'})
+        assert r.status_code == 400
+
 
 def test_rest_executors(env):
     rt = env.runtime_in_memory()
@@ -50,4 +64,63 @@ def test_rest_executors(env):
     with rt.serve(testing=True).test_client() as client:
         r = client.get("executors").get_json()
         assert len(r) == 1
-        assert r[0]["status"] == "running"
\ No newline at end of file
+        assert r[0]["status"] == "running"
+
+def test_rest_conditional_get(env):
+    rt = env.runtime_in_memory()
+    c = rt.register_collection("hello")
+    c.insert("e1", "A")
+    with rt.serve(testing=True).test_client() as client:
+        r = client.get("entries/hello")
+        assert r.status_code == 200
+        etag = r.headers["ETag"]
+
+        r = client.get("entries/hello", headers={"If-None-Match": etag})
+        assert r.status_code == 304
+
+        c.insert("e2", "B")
+        r = client.get("entries/hello", headers={"If-None-Match": etag})
+        assert r.status_code == 200
+        assert len(r.get_json()) == 2
+        assert r.headers["ETag"] != etag
+
+        for i in range(50):
+            c.insert("x" * 50 + str(i), "C")
+        r = client.get("entries/hello", headers={"Accept-Encoding": "gzip"})
+        assert r.headers["Content-Encoding"] == "gzip"
+        assert len(json.loads(gzip.decompress(r.data))) == 52
+        r = client.get("entries/hello", headers={"Accept-Encoding": "gzip",
+                                                 "If-None-Match": r.headers["ETag"]})
+        assert r.status_code == 304
+
+
+def test_rest_events(env):
+    rt = env.runtime_in_memory()
+    rt.register_executor(LocalExecutor())
+    c = rt.register_collection("hello", lambda c: c * 2)
+    other = rt.register_collection("other")
+    with rt.serve(testing=True).test_client() as client:
+        r = client.get("events", query_string={"collection": "hello"}, buffered=False)
+        assert r.mimetype == "text/event-stream"
+        stream = (chunk.decode() for chunk in r.response)
+        assert next(stream).startswith("retry:")
+
+        other.insert(1, "x")
+        c.compute(10)
+        c.remove(10)
+
+        events = []
+        while len(events) < 2:
+            lines = next(stream).strip().split("\n")
+            event = json.loads(lines[1][len("data: "):])
+            assert lines[0] == "event: " + event["type"]
+            if event["type"] != "executor":
+                events.append(event)
+        assert events[0]["type"] == "entry"
+        assert events[0]["collection"] == "hello"
+        assert events[0]["config"] == 10
+        assert events[0]["value_repr"] == "20"
+        assert events[0]["size"] == len(pickle.dumps(10)) + len(pickle.dumps(20))
+        assert events[1] == {"type": "removed", "collection": "hello", "keys": [events[0]["key"]]}
+        r.close()
+    assert not rt.events.has_subscribers
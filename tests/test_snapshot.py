@@ -0,0 +1,50 @@
+from orco import Runtime, LocalExecutor
+import pytest
+
+
+def test_snapshot_freeze(env, tmp_path):
+    runtime = env.runtime_in_memory()
+    runtime.register_executor(LocalExecutor())
+    col1 = runtime.register_collection("col1", lambda c: c * 10)
+    col2 = runtime.register_collection("col2", lambda c, d: sum(e.value for e in d),
+                                       lambda c: [col1.ref(x) for x in range(c["n"])])
+    other = runtime.register_collection("other")
+    col2.compute_many([{"n": 3}, {"n": 5}])
+    for i in range(2500):
+        other.insert(i, "same value")
+
+    path = str(tmp_path / "snapshot")
+    runtime.freeze(path)
+    runtime.freeze(str(tmp_path / "col1"), ["col1"])
+
+    snapshot = Runtime(path, backend="snapshot")
+    try:
+        s1 = snapshot.register_collection("col1")
+        s2 = snapshot.register_collection("col2")
+        s3 = snapshot.register_collection("other")
+        assert s2.get_entry({"n": 5}).value == 100
+        assert s2.get_entry({"n": 4}) is None
+        assert [s1.get_entry(i).value for i in range(5)] == [0, 10, 20, 30, 40]
+        assert s1.has_entry(4) and not s1.has_entry(5)
+        assert [e.value if e else None for e in s1.get_entries([4, 5, 0])] == [40, None, 0]
+        assert s1.has_entries([5, 1]) == [False, True]
+        assert s3.get_entry(2499).value == "same value"
+        assert len(s3.find()) == 2500
+        assert [e.config for e in s2.find({"n": {">": 3}})] == [{"n": 5}]
+
+        summaries = {c["name"]: c for c in snapshot.collection_summaries()}
+        assert summaries["col1"]["count"] == 5
+        assert summaries["other"]["count"] == 2500
+        assert summaries["other"]["physical_size"] < summaries["other"]["size"]
+        assert len(snapshot.entry_summaries("col2")) == 2
+
+        with pytest.raises(Exception):
+            s1.insert(100, 1)
+        with pytest.raises(Exception):
+            s2.compute({"n": 10})
+    finally:
+        snapshot.stop()
+
+    snapshot = Runtime(str(tmp_path / "col1"), backend="snapshot")
+    assert [c["name"] for c in snapshot.collection_summaries()] == ["col1"]
+    snapshot.stop()
@@ -0,0 +1,23 @@
+from orco.stress import run_stress, parse_mix, format_report, OPERATIONS
+import pytest
+
+
+def test_parse_mix():
+    assert parse_mix("compute=2,get") == {"compute": 2.0, "get": 1.0}
+    with pytest.raises(Exception):
+        parse_mix("compute=1,xxx=2")
+
+
+def test_stress(tmp_path, backend):
+    mix = {name: 1 for name in OPERATIONS}
+    report = run_stress(str(tmp_path / "db"), n_processes=2, duration=0.5, mix=mix,
+                        backend=backend, n_configs=20, value_size=16)
+    assert set(report["operations"]) == set(OPERATIONS)
+    assert report["throughput"] > 0
+    for name, summary in report["operations"].items():
+        assert summary["count"] > 0
+        assert summary["p50"] <= summary["p99"] <= summary["max"]
+    assert not report["operations"]["get"]["errors"]
+    assert not report["operations"]["rest"]["errors"]
+    assert report["db_calls"]["get_entries"]["count"] == report["operations"]["get"]["count"]
+    assert "compute" in format_report(report)
@@ -0,0 +1,68 @@
+from orco import LocalExecutor
+import json
+import threading
+
+
+def test_trace_compute(env, tmp_path):
+    runtime = env.runtime_in_memory()
+    runtime.register_executor(LocalExecutor(n_workers=2))
+    col1 = runtime.register_collection("col1", lambda c: c * 10)
+    col2 = runtime.register_collection("col2", lambda c, d: sum(e.value for e in d),
+                                       lambda c: [col1.ref(x) for x in range(c)])
+    db = runtime.db
+
+    with runtime.trace() as tracer:
+        assert col2.compute(4).value == 60
+    assert runtime.db is db
+    assert runtime.tracer is None
+
+    path = str(tmp_path / "trace.json")
+    tracer.save(path)
+    with open(path) as f:
+        trace = json.load(f)
+
+    spans = [e for e in trace["traceEvents"] if e["ph"] == "X"]
+    names = [e["name"] for e in spans]
+    for name in ("compute", "plan", "dep_fn", "build", "db.announce_entries", "db.set_entry_values"):
+        assert name in names
+    assert names.count("build") == 5
+    assert all(e["dur"] >= 0 for e in spans)
+
+    compute = spans[names.index("compute")]
+    assert all(compute["ts"] <= e["ts"] <= compute["ts"] + compute["dur"] for e in spans)
+
+    thread_names = [e["args"]["name"] for e in trace["traceEvents"] if e["name"] == "thread_name"]
+    assert "MainThread" in thread_names
+
+    col2.compute(5)
+    assert len(tracer.events) == len(spans)
+
+
+def test_trace_scoped_to_thread(env):
+    runtime = env.runtime_in_memory()
+    runtime.register_executor(LocalExecutor(n_workers=2))
+    col1 = runtime.register_collection("col1", lambda c: c * 10)
+    db = runtime.db
+
+    def compute_other():
+        assert runtime.tracer is None
+        assert runtime.db is db
+        col1.compute_many(list(range(100, 110)))
+
+    with runtime.trace() as tracer:
+        thread = threading.Thread(target=compute_other)
+        thread.start()
+        thread.join()
+        with runtime.trace() as inner:
+            col1.compute(1)
+        assert runtime.tracer is tracer
+        col1.compute(2)
+    assert runtime.tracer is None
+    assert runtime.db is db
+
+    def n_builds(t):
+        return sum(e["name"] == "build" for e in t.events)
+
+    assert n_builds(inner) == 1
+    assert n_builds(tracer) == 1
+    assert "db.set_entry_values" in [e["name"] for e in inner.events]